@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare single pass and two-stage (-fastdownsample) downsampling.
+
+Usage: python bench/downsample.py [width height [mode [workers]]]
+
+Downsamples a synthetic image by the factors of typical hires to output
+resolution ratios (e.g. 2400 -> 300 dpi) and prints the time per run and
+the throughput in source megapixels per second.
+
+"""
+
+import os
+import sys
+from time import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageChops
+
+from lib.util_image import reduce_resize, resize_parallel
+
+
+def synthetic(mode, size):
+	""" Gradient with some noise, so the filters have something to do. """
+	gradient = Image.new("L", (256, 256))
+	gradient.putdata([y for y in xrange(256) for x in xrange(256)])
+	gradient = gradient.resize(size)
+	noise = Image.frombuffer("L", (256, 256), os.urandom(256 * 256), "raw",
+							 "L", 0, 1).resize(size)
+	band = ImageChops.add(gradient, noise, 2)
+	return Image.merge(mode, [band] * len(mode))
+
+
+def timeit(func, runs=3):
+	best = None
+	for i in xrange(runs):
+		start = time()
+		func()
+		elapsed = time() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best
+
+
+def main(width=6000, height=4000, mode="RGB", workers=1):
+	image = synthetic(mode, (width, height))
+	image.load()
+	mpx = width * height / 1000000.0
+	print "%ix%i %s, %i worker(s)" % (width, height, mode, workers)
+	print "%-12s %12s %12s %12s" % ("factor", "single pass", "two-stage",
+									"speedup")
+	for hires, lores in ((600, 300), (1200, 300), (2400, 300), (2400, 150)):
+		size = (width * lores // hires, height * lores // hires)
+		single = timeit(lambda: resize_parallel(image, size, Image.ANTIALIAS,
+												workers))
+		fast = timeit(lambda: reduce_resize(image, size, Image.ANTIALIAS,
+											workers))
+		print "%-12s %9.0f ms %9.0f ms %11.1fx" % ("%i -> %i" % (hires, lores),
+												   single * 1000, fast * 1000,
+												   single / fast)
+		print "%-12s %7.1f Mpx/s %7.1f Mpx/s" % ("", mpx / single, mpx / fast)
+
+
+if __name__ == "__main__":
+	args = sys.argv[1:]
+	main(*[int(arg) for arg in args[:2]] + args[2:3] +
+		 [int(arg) for arg in args[3:4]])
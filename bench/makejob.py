@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Generate a synthetic OPI job with matching hires images.
+
+Usage: python bench/makejob.py <directory> [-option=value ...]
+
+Options (defaults in parentheses):
+ -flavor=[1.3|2.0]    QuarkXPress-style OPI 1.3 (%ALD*) or InDesign-style
+                      OPI 2.0 (%%BeginOPI: 2.0) comments (1.3)
+ -pages=1             number of pages
+ -placements=8        image placements per page
+ -repeats=1           how often each hires image is placed (round robin
+                      over the job, so repeated images hit the caches)
+ -crop=1.0            visible fraction of the image width and height
+ -newline=[cr|lf|crlf] line endings of the job (lf)
+ -formats=tiff,jpeg,png,eps  hires file formats
+ -modes=L,RGB,CMYK,1  hires image modes, cycled per image (the format
+                      shifts by one each cycle, so all combinations occur)
+ -size=2400x1600      hires image size in pixels
+ -dpi=1200            hires image resolution (the placed size is chosen so
+                      the effective resolution is the same)
+ -lowres=8            reduction factor of the (dummy) lowres data
+
+The job is written to <directory>/job.ps and the images to
+<directory>/hires. Process it with
+-lores=/Bench/Lowres -hires=<directory>/hires.
+Combinations PIL can't write (CMYK PNG, 1-bit JPEG) are written as TIFF.
+
+"""
+
+import binascii
+import math
+import os
+import sys
+
+from PIL import Image
+
+from downsample import synthetic
+
+newlines = {"cr": "\r", "lf": "\n", "crlf": "\r\n"}
+
+extensions = {"tiff": ".tif", "jpeg": ".jpg", "png": ".png", "eps": ".eps"}
+
+# Volume/folder of the lowres images as referenced in the job
+lorespath = ("Bench", "Lowres")
+
+
+def makeimage(mode, size):
+	""" Synthetic image in mode (L, RGB, CMYK or 1) """
+	if mode == "1":
+		return synthetic("L", size).convert("1")
+	return synthetic(mode, size)
+
+
+def writeeps(image, filename, dpi):
+	""" Write image as an ASCII EPS file with hex image data """
+	width, height = image.size
+	bbox = (width * 72.0 / dpi, height * 72.0 / dpi)
+	if image.mode == "1":
+		bits = 1
+		rowbytes = (width + 7) // 8
+	else:
+		bits = 8
+		rowbytes = width * len(image.mode)
+	if image.mode in ("1", "L"):
+		operator = "image"
+	else:
+		operator = "false %i colorimage" % len(image.mode)
+	if hasattr(image, "tobytes"):
+		# Pillow >= 2.0 (tostring raises NotImplementedError in Pillow >= 3)
+		data = image.tobytes()
+	else:
+		data = image.tostring()
+	epsf = open(filename, "wb")
+	try:
+		epsf.write("%%!PS-Adobe-3.0 EPSF-3.0\n"
+				   "%%%%BoundingBox: 0 0 %i %i\n"
+				   "%%%%HiResBoundingBox: 0 0 %.4f %.4f\n"
+				   "%%%%Creator: makejob.py\n"
+				   "%%%%EndComments\n"
+				   "gsave\n"
+				   "%.4f %.4f scale\n"
+				   "/line %i string def\n"
+				   "%i %i %i [%i 0 0 -%i 0 %i]\n"
+				   "{currentfile line readhexstring pop} %s\n" %
+				   (math.ceil(bbox[0]), math.ceil(bbox[1]), bbox[0], bbox[1],
+					bbox[0], bbox[1], rowbytes, width, height, bits, width,
+					height, height, operator))
+		for y in xrange(height):
+			epsf.write(binascii.hexlify(data[y * rowbytes:
+											 (y + 1) * rowbytes]) + "\n")
+		epsf.write("grestore\n%%EOF\n")
+	finally:
+		epsf.close()
+
+
+def saveimage(image, directory, name, format, dpi):
+	""" Save image, returns the filename (without directory) """
+	if ((format == "png" and image.mode == "CMYK") or
+		(format == "jpeg" and image.mode == "1")):
+		format = "tiff"
+	filename = name + extensions[format]
+	if format == "eps":
+		writeeps(image, os.path.join(directory, filename), dpi)
+	elif format == "jpeg":
+		image.save(os.path.join(directory, filename), "JPEG", quality=90,
+				   dpi=(dpi, dpi))
+	else:
+		image.save(os.path.join(directory, filename), format.upper(),
+				   dpi=(dpi, dpi))
+	return filename
+
+
+def lowresdata(size, channels, newline):
+	""" Dummy hex data standing in for the lowres image in the job """
+	row = "0" * (size[0] * channels * 2) + newline
+	return row * size[1]
+
+
+def placement13(filename, size, crop, position, mode, lowres, newline):
+	""" QuarkXPress-style OPI 1.3 placement """
+	left, top, right, bottom = crop
+	x, y, width, height = position
+	channels = len(mode.replace("1", "L"))
+	lines = ["%%ALDImageFileName: %s" % ":".join(lorespath + (filename, )),
+			 "%%ALDImageDimensions: %i %i" % size,
+			 "%%ALDImageCropRect: %i %i %i %i" % crop,
+			 "%%ALDImageCropFixed: %.4f %.4f %.4f %.4f" % crop,
+			 "%%ALDImagePosition: %.4f %.4f %.4f %.4f %.4f %.4f %.4f %.4f" %
+			 (x, y, x, y + height, x + width, y + height, x + width, y)]
+	if mode in ("1", "L"):
+		lines += ["%ALDImageColorType: Process",
+				  "%ALDImageColor: 0 0 0 1 (Black)",
+				  "%ALDImageTint: 1"]
+	lines += ["%%ALDImageType: %i %i" % (channels, mode == "1" and 1 or 8),
+			  "%%BeginObject: image",
+			  "%.4f %.4f translate %.4f %.4f scale" % position]
+	lowressize = ((right - left) // lowres or 1, (bottom - top) // lowres or 1)
+	return (newline.join(lines) + newline +
+			lowresdata(lowressize, channels, newline) +
+			"%%EndObject" + newline)
+
+
+def placement20(filename, size, crop, position, mode, lowres, newline):
+	""" InDesign-style OPI 2.0 placement """
+	left, top, right, bottom = crop
+	channels = len(mode.replace("1", "L"))
+	if mode in ("1", "L"):
+		inks = "monochrome 1 (Black) 1.0"
+	else:
+		inks = "full_color"
+	lowressize = ((right - left) // lowres or 1, (bottom - top) // lowres or 1)
+	lines = ["%%BeginOPI: 2.0",
+			 "%%Distilled",
+			 "%%%%ImageFileName: (%s)" % ":".join(lorespath + (filename, )),
+			 "%%%%ImageDimensions: %i %i" % size,
+			 "%%%%ImageCropRect: %i %i %i %i" % crop,
+			 "%%%%ImageInks: %s" % inks,
+			 "gsave",
+			 "%.4f %.4f translate %.4f %.4f scale" % position,
+			 "%%BeginIncludedImage",
+			 "%%%%IncludedImageDimensions: %i %i" % lowressize,
+			 "%%IncludedImageQuality: 1.0"]
+	return (newline.join(lines) + newline +
+			lowresdata(lowressize, channels, newline) +
+			"%%EndIncludedImage" + newline +
+			"%%EndOPI" + newline +
+			"grestore" + newline)
+
+
+def makejob(directory, flavor="1.3", pages=1, placements=8, repeats=1,
+			crop=1.0, newline="\n", formats=("tiff", "jpeg", "png", "eps"),
+			modes=("L", "RGB", "CMYK", "1"), size=(2400, 1600), dpi=1200,
+			lowres=8):
+	"""
+	Write a job and its hires images to directory.
+
+	Returns a dict with the job filename, hires directory, number of
+	images and placements, and the size in bytes of the job and images.
+
+	"""
+	hires = os.path.join(directory, "hires")
+	if not os.path.isdir(hires):
+		os.makedirs(hires)
+	total = pages * placements
+	count = max(1, int(math.ceil(total / float(repeats))))
+	images = []
+	imagebytes = 0
+	for i in xrange(count):
+		mode = modes[i % len(modes)]
+		format = formats[(i + i // len(modes)) % len(formats)]
+		filename = saveimage(makeimage(mode, size), hires,
+							 "img%04i-%s" % (i + 1, mode), format, dpi)
+		imagebytes += os.path.getsize(os.path.join(hires, filename))
+		images.append((filename, mode))
+	# Centered crop rectangle in image pixels
+	width = int(round(size[0] * crop))
+	height = int(round(size[1] * crop))
+	left = (size[0] - width) // 2
+	top = (size[1] - height) // 2
+	croprect = (left, top, left + width, top + height)
+	# Placed size in pt, so the effective resolution is dpi
+	placed = (width * 72.0 / dpi, height * 72.0 / dpi)
+	columns = int(math.ceil(math.sqrt(placements)))
+	if flavor == "2.0":
+		placement = placement20
+		creator = "Adobe InDesign CS3 (5.0)"
+		procsets = "Adobe_AGM_Image 1.0 0"
+	else:
+		placement = placement13
+		creator = "QuarkXPress(tm) 7.0"
+		procsets = "QuarkXPress_7 7.0 0"
+	jobname = os.path.join(directory, "job.ps")
+	job = open(jobname, "wb")
+	try:
+		job.write(newline.join(["%!PS-Adobe-3.0",
+								"%%Creator: " + creator,
+								"%%Pages: " + str(pages),
+								"%%DocumentProcSets: " + procsets,
+								"%%EndComments",
+								"%%BeginProlog",
+								"/bd {bind def} bind def",
+								"%%EndProlog",
+								"%%BeginSetup",
+								"%%EndSetup"]) + newline)
+		n = 0
+		for page in xrange(pages):
+			job.write("%%%%Page: %i %i%s" % (page + 1, page + 1, newline))
+			job.write("gsave" + newline)
+			for i in xrange(placements):
+				filename, mode = images[n % count]
+				n += 1
+				position = (36 + (i % columns) * 72,
+							36 + (i // columns) * 72) + placed
+				job.write(placement(filename, size, croprect, position, mode,
+									lowres, newline))
+			job.write("grestore" + newline + "showpage" + newline)
+			job.write("%%PageTrailer" + newline)
+		job.write("%%Trailer" + newline + "%%EOF" + newline)
+	finally:
+		job.close()
+	return {"job": jobname,
+			"hires": hires,
+			"images": count,
+			"placements": total,
+			"jobbytes": os.path.getsize(jobname),
+			"imagebytes": imagebytes}
+
+
+def parseargs(args):
+	""" Parse -option=value arguments into makejob() keyword arguments """
+	kwargs = {}
+	for arg in args:
+		key, value = arg.lstrip("-").split("=", 1)
+		key = key.lower()
+		if key in ("pages", "placements", "repeats", "dpi", "lowres"):
+			kwargs[key] = int(value)
+		elif key == "crop":
+			kwargs[key] = float(value)
+		elif key == "flavor":
+			kwargs[key] = value
+		elif key == "newline":
+			kwargs[key] = newlines[value.lower()]
+		elif key in ("formats", "modes"):
+			kwargs[key] = tuple(item.strip() for item in value.split(","))
+			if key == "formats":
+				kwargs[key] = tuple(item.lower() for item in kwargs[key])
+		elif key == "size":
+			kwargs[key] = tuple(int(item) for item in value.lower().split("x"))
+		else:
+			raise ValueError("Unknown option: " + arg)
+	return kwargs
+
+
+def main(args):
+	if not args or args[0].startswith("-"):
+		print __doc__
+		return
+	result = makejob(args[0], **parseargs(args[1:]))
+	print "%(job)s: %(placements)i placement(s) of %(images)i image(s)" % result
+	print "job %.1f MB, hires images %.1f MB" % (result["jobbytes"] / 1048576.0,
+												 result["imagebytes"] /
+												 1048576.0)
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
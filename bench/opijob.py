@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Run opi.py on synthetic OPI jobs and report the throughput.
+
+Usage: python bench/opijob.py [-runs=3] [-dir=<directory>] [makejob options]
+                              [-- opi.py options]
+
+Generates a job for each OPI flavor (or only the one given with -flavor)
+with bench/makejob.py (see there for the options), processes it with
+opi.py and prints the best time of -runs runs, the throughput in MB/s of
+job plus hires image data read and of output written, and in images per
+second. Options after -- are passed on to opi.py (e.g. -workers=4 or
+-usecache=0). Jobs are generated in a temporary directory unless -dir is
+given, in which case they are kept.
+
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from time import sleep, time
+
+import makejob
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def runopi(job, hires, output, options, timeout=3600):
+	"""
+	Process job with opi.py, returns the elapsed time in seconds.
+
+	opi.py keeps its log window open if an error occurs, so it is killed
+	after timeout seconds.
+
+	"""
+	args = [sys.executable, "-u", os.path.join(root, "opi.py"),
+			"-in=" + job, "-out=" + output, "-hires=" + hires,
+			"-lores=/" + "/".join(makejob.lorespath),
+			"-log=" + os.path.splitext(output)[0] + ".log"] + options
+	start = time()
+	process = subprocess.Popen(args, cwd=root)
+	while process.poll() is None:
+		if time() - start > timeout:
+			process.kill()
+			raise RuntimeError("opi.py did not finish within %i seconds "
+							   "(see %s.log)" % (timeout,
+												 os.path.splitext(output)[0]))
+		sleep(.01)
+	elapsed = time() - start
+	if process.returncode:
+		raise RuntimeError("opi.py exited with status %i" % process.returncode)
+	if not os.path.getsize(output):
+		# opi.py writes an empty output file if any placement failed
+		raise RuntimeError("opi.py wrote no output (see %s.log)" %
+						   os.path.splitext(output)[0])
+	return elapsed
+
+
+def main(args):
+	runs = 3
+	directory = None
+	options = []
+	if "--" in args:
+		options = args[args.index("--") + 1:]
+		args = args[:args.index("--")]
+	jobargs = []
+	for arg in args:
+		if arg.startswith("-runs="):
+			runs = int(arg.split("=", 1)[1])
+		elif arg.startswith("-dir="):
+			directory = arg.split("=", 1)[1]
+		elif arg in ("-h", "-help", "--help"):
+			print __doc__
+			return
+		else:
+			jobargs.append(arg)
+	kwargs = makejob.parseargs(jobargs)
+	if "flavor" in kwargs:
+		flavors = [kwargs.pop("flavor")]
+	else:
+		flavors = ["1.3", "2.0"]
+	tmpdir = directory or tempfile.mkdtemp(prefix="opibench")
+	try:
+		print "%-6s %7s %9s %9s %9s %9s %9s %9s" % ("OPI", "images",
+													"in (MB)", "out (MB)",
+													"time (s)", "MB/s in",
+													"MB/s out", "images/s")
+		for flavor in flavors:
+			jobdir = os.path.join(tmpdir, flavor)
+			job = makejob.makejob(jobdir, flavor, **kwargs)
+			output = os.path.join(jobdir, "out.ps")
+			best = min(runopi(job["job"], job["hires"], output, options)
+					   for i in xrange(runs))
+			inbytes = job["jobbytes"] + job["imagebytes"]
+			outbytes = os.path.getsize(output)
+			print "%-6s %7i %9.1f %9.1f %9.2f %9.1f %9.1f %9.2f" % (
+				flavor, job["placements"], inbytes / 1048576.0,
+				outbytes / 1048576.0, best, inbytes / 1048576.0 / best,
+				outbytes / 1048576.0 / best, job["placements"] / best)
+	finally:
+		if not directory:
+			shutil.rmtree(tmpdir, True)
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import os
+from time import time
+try:
+	import json
+except ImportError:
+	# Python 2.5
+	json = None
+
+# Processing stages of an OPI object in pipeline order, with table headings
+stages = (("resolve", "Resolve"),
+		  ("open", "Open/decode"),
+		  ("detect", "Gray detect"),
+		  ("crop", "Crop"),
+		  ("downsample", "Downsample"),
+		  ("convert", "ICC transform"),
+		  ("encode", "Encode"),
+		  ("write", "Write"))
+
+
+def cputime():
+	""" User + system CPU time of the process (all threads) """
+	times = os.times()
+	return times[0] + times[1]
+
+
+class ImageStats(object):
+
+	"""
+	Timing of the processing stages of one OPI object.
+
+	Wall and CPU time are accumulated per stage name. Only one stage is
+	running at a time: stage() stops the running stage and starts the next
+	one, stage(None) just stops it. Stages are also added to tracelog (a
+	TraceLog) if given.
+
+	"""
+
+	def __init__(self, name, tracelog=None):
+		self.name = name
+		self.tracelog = tracelog
+		self.wall = {}
+		self.cpu = {}
+		self.bytesin = 0
+		self.bytesout = 0
+		# Where the image came from: memory, disk (cache) or file
+		self.cache = ""
+		self._stage = None
+		self._start = None
+
+	def stage(self, name):
+		now = time(), cputime()
+		if self._stage:
+			self.wall[self._stage] = (self.wall.get(self._stage, 0.0) +
+									  now[0] - self._start[0])
+			self.cpu[self._stage] = (self.cpu.get(self._stage, 0.0) +
+									 now[1] - self._start[1])
+			if self.tracelog:
+				self.tracelog.end(self._stage, "stage")
+		self._stage = name
+		self._start = now
+		if name and self.tracelog:
+			self.tracelog.begin(name, "stage")
+
+	def totalwall(self):
+		return sum(self.wall.itervalues(), 0.0)
+
+	def totalcpu(self):
+		return sum(self.cpu.itervalues(), 0.0)
+
+	def asdict(self):
+		result = {"name": self.name,
+				  "cache": self.cache,
+				  "bytes_in": self.bytesin,
+				  "bytes_out": self.bytesout,
+				  "wall": self.totalwall(),
+				  "cpu": self.totalcpu()}
+		for name, title in stages:
+			result[name + "_wall"] = self.wall.get(name, 0.0)
+			result[name + "_cpu"] = self.cpu.get(name, 0.0)
+		return result
+
+
+class JobStats(object):
+
+	""" Per-image stage timings of a job, with summary and report output """
+
+	def __init__(self, tracelog=None):
+		self.images = []
+		self.current = None
+		self.start = time(), cputime()
+		self.tracelog = tracelog
+
+	def begin(self, name):
+		""" Start recording a new OPI object """
+		self.end()
+		self.current = ImageStats(name, self.tracelog)
+		self.images.append(self.current)
+		if self.tracelog:
+			self.tracelog.begin("OPI object", "object", image=name)
+
+	def end(self):
+		if self.current:
+			self.current.stage(None)
+			if self.tracelog:
+				self.tracelog.end("OPI object", "object",
+								  cache=self.current.cache,
+								  bytes_in=self.current.bytesin,
+								  bytes_out=self.current.bytesout)
+			self.current = None
+
+	def stage(self, name):
+		if self.current:
+			self.current.stage(name)
+
+	def set(self, **values):
+		""" Set attributes (bytesin, bytesout, cache) of the current object """
+		if self.current:
+			for key in values:
+				setattr(self.current, key, values[key])
+
+	def summary(self, verbose=False):
+		"""
+		Return the job summary as a list of lines.
+
+		A table of wall and CPU time per stage, summed over all objects,
+		followed by totals. With verbose, a line per object is added.
+
+		"""
+		self.end()
+		elapsed = time() - self.start[0], cputime() - self.start[1]
+		lines = ["%-14s %10s %10s %6s" % ("Stage", "Wall (s)", "CPU (s)",
+										  "Wall %")]
+		for name, title in stages:
+			wall = sum(image.wall.get(name, 0.0) for image in self.images)
+			cpu = sum(image.cpu.get(name, 0.0) for image in self.images)
+			lines.append("%-14s %10.3f %10.3f %5.1f%%" %
+						 (title, wall, cpu, elapsed[0] and
+						  wall / elapsed[0] * 100))
+		lines.append("%-14s %10.3f %10.3f" % ("Job", elapsed[0], elapsed[1]))
+		cache = {}
+		for image in self.images:
+			cache[image.cache] = cache.get(image.cache, 0) + 1
+		lines.append("%i object(s), %i bytes in, %i bytes out, source: %s" %
+					 (len(self.images),
+					  sum(image.bytesin for image in self.images),
+					  sum(image.bytesout for image in self.images),
+					  ", ".join("%i %s" % (cache[key], key or "none")
+								for key in sorted(cache))))
+		if verbose:
+			for image in self.images:
+				lines.append("%8.3f s %8.3f s CPU %-6s %s" %
+							 (image.totalwall(), image.totalcpu(),
+							  image.cache, image.name))
+		return lines
+
+	def write(self, filename):
+		"""
+		Write a per-object report.
+
+		CSV if the filename ends with .csv, JSON otherwise.
+
+		"""
+		self.end()
+		rows = [image.asdict() for image in self.images]
+		if filename.lower().endswith(".csv"):
+			fields = ["name", "cache", "bytes_in", "bytes_out", "wall", "cpu"]
+			for name, title in stages:
+				fields.extend([name + "_wall", name + "_cpu"])
+			reportfile = open(filename, "wb")
+			try:
+				writer = csv.writer(reportfile)
+				writer.writerow(fields)
+				for row in rows:
+					writer.writerow([isinstance(row[field], unicode) and
+									 row[field].encode("utf-8") or row[field]
+									 for field in fields])
+			finally:
+				reportfile.close()
+		else:
+			if not json:
+				raise ImportError("JSON reports need Python 2.6 or newer")
+			reportfile = open(filename, "wb")
+			try:
+				json.dump({"wall": time() - self.start[0],
+						   "cpu": cputime() - self.start[1],
+						   "stages": [name for name, title in stages],
+						   "images": rows}, reportfile, indent=1)
+			finally:
+				reportfile.close()
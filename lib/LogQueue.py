@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+from Queue import Empty, Queue
+import sys
+import threading
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+levels = {"debug": DEBUG,
+		  "info": INFO,
+		  "warning": WARNING,
+		  "error": ERROR}
+
+
+class LogQueue:
+
+	"""
+	Write log messages in a background thread.
+
+	put() only queues the message together with its arguments, so logging
+	does not wait for formatting or for the handlers. The writer thread
+	formats all queued messages with formatter and passes them as a list of
+	lines to each handler in one batch.
+
+	"""
+
+	def __init__(self, formatter, handlers):
+		self.formatter = formatter
+		self.handlers = handlers
+		self._queue = Queue()
+		self._thread = threading.Thread(target=self._run)
+		self._thread.setDaemon(True)
+		self._thread.start()
+
+	def put(self, *item):
+		self._queue.put(item)
+
+	def flush(self):
+		""" Wait until all queued messages are written """
+		self._queue.join()
+
+	def close(self):
+		self._queue.put(None)
+		self._thread.join()
+
+	def _run(self):
+		while True:
+			items = [self._queue.get()]
+			try:
+				while True:
+					items.append(self._queue.get_nowait())
+			except Empty:
+				pass
+			lines = []
+			for item in items:
+				if item is not None:
+					try:
+						lines.append(self.formatter(*item))
+					except Exception, v:
+						lines.append("Log formatting error: %r %s" % (item, v))
+			for handler in self.handlers:
+				try:
+					handler(lines)
+				except Exception, v:
+					sys.stderr.write("Log handler error: %s\n" % v)
+			for item in items:
+				self._queue.task_done()
+			if None in items:
+				break
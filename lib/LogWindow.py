@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
-from thread import start_new_thread
+from collections import deque
+from thread import allocate_lock, start_new_thread
 from time import sleep, strftime
 import subprocess as sp
 import time
@@ -8,7 +9,20 @@ import wx
 
 class LogWindow(wx.Frame):
 
-	def __init__(self, title = "Log", size = (600, 600), format = "%Y-%m-%d %H:%M:%S "):
+	"""
+	Log window which shows the last maxlines lines.
+	
+	write() and writelines() can be called from any thread. They only
+	queue the lines, which are appended to the text control in one batch
+	every interval milliseconds by the GUI thread. Lines beyond maxlines
+	are removed from the top of the text control (and dropped from the
+	queue if the GUI thread falls behind), so the full history should be
+	kept in a log file.
+	
+	"""
+
+	def __init__(self, title = "Log", size = (600, 600), format = "%Y-%m-%d %H:%M:%S ",
+				 maxlines = 10000, interval = 250):
 		## frame and textbox
 		wx.Frame.__init__(self, None, -1, "", style = wx.DEFAULT_FRAME_STYLE)
 		self.log = wx.TextCtrl(self, -1, "", style = wx.TE_MULTILINE | wx.TE_READONLY)
@@ -20,11 +34,72 @@ class LogWindow(wx.Frame):
 		## format for strftime
 		self.format = format
 
+		## ring buffer
+		self.maxlines = maxlines
+		self._pending = deque()
+		self._pendinglines = 0
+		self._lock = allocate_lock()
+		self._linecount = 0
+
+		## batched appends
+		self._timer = wx.Timer(self)
+		self.Bind(wx.EVT_TIMER, self.OnTimer, self._timer)
+		self._timer.Start(interval)
+
 	def write(self, line = None):
-		if line:
-			self.log.AppendText(strftime(self.format) + line + "\n")
+		self.writelines([line])
+
+	def writelines(self, lines):
+		if self.format:
+			prefix = strftime(self.format)
 		else:
-			self.log.AppendText("\n")
+			prefix = ""
+		self._lock.acquire()
+		try:
+			for line in lines:
+				if line:
+					line = prefix + line + "\n"
+				else:
+					line = "\n"
+				self._pending.append(line)
+				self._pendinglines += line.count("\n")
+			# Entries can span several lines (e.g. tracebacks), so the queue
+			# is limited by lines
+			while self._pendinglines > self.maxlines and len(self._pending) > 1:
+				self._pendinglines -= self._pending.popleft().count("\n")
+		finally:
+			self._lock.release()
+
+	def OnTimer(self, event):
+		self._lock.acquire()
+		try:
+			if not self._pending:
+				return
+			text = "".join(self._pending)
+			lines = self._pendinglines
+			self._pending.clear()
+			self._pendinglines = 0
+		finally:
+			self._lock.release()
+		if lines > self.maxlines:
+			# A single entry longer than the window
+			text = "\n".join(text.split("\n")[-self.maxlines - 1:])
+			lines = self.maxlines
+		self.log.Freeze()
+		try:
+			excess = self._linecount + lines - self.maxlines
+			if excess > 0:
+				# Never more than the text control holds (the last line is
+				# the empty one after the final newline)
+				excess = min(excess, self.log.GetNumberOfLines() - 1)
+				position = self.log.XYToPosition(0, excess)
+				if excess > 0 and position >= 0:
+					self.log.Remove(0, position)
+					self._linecount -= excess
+			self.log.AppendText(text)
+			self._linecount += lines
+		finally:
+			self.log.Thaw()
 
 
 if __name__=="__main__":
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import sys
+try:
+	import resource
+except ImportError:
+	# Windows
+	resource = None
+try:
+	import tracemalloc
+except ImportError:
+	# Python < 3.4 without the pytracemalloc backport
+	tracemalloc = None
+
+
+def maxrss():
+	""" Peak resident set size of the process in bytes, or None """
+	if not resource:
+		return None
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform == "darwin":
+		# Mac OS X reports bytes
+		return rss
+	# Linux and BSD report kilobytes
+	return rss * 1024
+
+
+class MemProfiler(object):
+
+	"""
+	Memory usage at the boundaries of a job (e.g. after each OPI object).
+
+	With tracemalloc, the snapshot taken at the boundary with the most
+	traced memory is kept, and report() lists its top allocation sites
+	together with the peak. Without tracemalloc, the peak resident set
+	size is tracked instead, and report() lists the most common object
+	types.
+
+	"""
+
+	def __init__(self, limit=10):
+		self.limit = limit
+		self.peak = 0
+		self.peaklabel = None
+		self._snapshot = None
+		self._current = 0
+		if tracemalloc:
+			tracemalloc.start()
+
+	def snapshot(self, label):
+		""" Record memory usage. Returns a line describing it. """
+		if tracemalloc:
+			current, peak = tracemalloc.get_traced_memory()
+			if peak > self.peak:
+				self.peak = peak
+				self.peaklabel = label
+			if current >= self._current:
+				self._current = current
+				self._snapshot = tracemalloc.take_snapshot()
+			if hasattr(tracemalloc, "reset_peak"):
+				# Attribute the next peak to the next label (Python 3.9+)
+				tracemalloc.reset_peak()
+			return ("Memory: %.1f MB traced, peak %.1f MB" %
+					(current / 1048576.0, peak / 1048576.0))
+		rss = maxrss()
+		if rss is None:
+			return "Memory: not available on this platform"
+		if rss > self.peak:
+			self.peak = rss
+			self.peaklabel = label
+		return "Memory: peak RSS %.1f MB" % (rss / 1048576.0)
+
+	def report(self):
+		""" Return the memory report as a list of lines """
+		lines = []
+		if tracemalloc:
+			lines.append("Peak traced memory: %.1f MB (%s)" %
+						 (self.peak / 1048576.0, self.peaklabel))
+			if self._snapshot:
+				lines.append("Top allocation sites at %.1f MB traced:" %
+							 (self._current / 1048576.0))
+				for stat in self._snapshot.statistics("lineno")[:self.limit]:
+					lines.append("  %s" % stat)
+		else:
+			if self.peak:
+				lines.append("Peak RSS: %.1f MB (%s)" % (self.peak / 1048576.0,
+														  self.peaklabel))
+			lines.append("tracemalloc not available, most common object "
+						 "types:")
+			counts = {}
+			for obj in gc.get_objects():
+				name = type(obj).__name__
+				counts[name] = counts.get(name, 0) + 1
+			for count, name in sorted([(count, name) for name, count in
+									   counts.iteritems()],
+									  reverse=True)[:self.limit]:
+				lines.append("  %8i %s" % (count, name))
+		return lines
+
+	def close(self):
+		if tracemalloc:
+			tracemalloc.stop()
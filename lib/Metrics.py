@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from thread import allocate_lock
+import os
+import threading
+
+from ordereddict import OrderedDict
+
+# Default histogram buckets in seconds
+buckets = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+
+def escape(value):
+	return (unicode(value).replace("\\", "\\\\").replace("\n", "\\n")
+			.replace('"', '\\"'))
+
+
+def formatvalue(value):
+	if value == float("inf"):
+		return "+Inf"
+	if isinstance(value, float):
+		return repr(value)
+	return str(value)
+
+
+class Metrics(object):
+
+	"""
+	Registry of counters, gauges and histograms.
+
+	render() returns the metrics in the Prometheus text exposition format.
+	All methods can be called from any thread.
+
+	"""
+
+	def __init__(self):
+		self._lock = allocate_lock()
+		self._metrics = OrderedDict()
+
+	def _register(self, name, type, help, buckets=None):
+		self._metrics[name] = {"type": type,
+							   "help": help,
+							   "buckets": buckets,
+							   "values": OrderedDict()}
+
+	def counter(self, name, help):
+		self._register(name, "counter", help)
+
+	def gauge(self, name, help):
+		self._register(name, "gauge", help)
+
+	def histogram(self, name, help, buckets=buckets):
+		self._register(name, "histogram", help, tuple(buckets) +
+											   (float("inf"), ))
+
+	def inc(self, name, value=1, **labels):
+		key = tuple(sorted(labels.items()))
+		self._lock.acquire()
+		try:
+			values = self._metrics[name]["values"]
+			values[key] = values.get(key, 0) + value
+		finally:
+			self._lock.release()
+
+	def set(self, name, value, **labels):
+		self._lock.acquire()
+		try:
+			self._metrics[name]["values"][tuple(sorted(labels.items()))] = value
+		finally:
+			self._lock.release()
+
+	def observe(self, name, value, **labels):
+		key = tuple(sorted(labels.items()))
+		self._lock.acquire()
+		try:
+			metric = self._metrics[name]
+			if not key in metric["values"]:
+				# Bucket counts, sum, count
+				metric["values"][key] = [[0] * len(metric["buckets"]), 0.0, 0]
+			counts, total, count = metric["values"][key]
+			for i, bound in enumerate(metric["buckets"]):
+				if value <= bound:
+					counts[i] += 1
+			metric["values"][key] = [counts, total + value, count + 1]
+		finally:
+			self._lock.release()
+
+	def render(self):
+		lines = []
+		self._lock.acquire()
+		try:
+			for name, metric in self._metrics.iteritems():
+				lines.append("# HELP %s %s" % (name, metric["help"]))
+				lines.append("# TYPE %s %s" % (name, metric["type"]))
+				for key, value in metric["values"].iteritems():
+					if metric["type"] == "histogram":
+						counts, total, count = value
+						for bound, bucketcount in zip(metric["buckets"],
+													  counts):
+							lines.append(self._sample(name + "_bucket",
+													  key + (("le", formatvalue(bound)), ),
+													  bucketcount))
+						lines.append(self._sample(name + "_sum", key, total))
+						lines.append(self._sample(name + "_count", key, count))
+					else:
+						lines.append(self._sample(name, key, value))
+		finally:
+			self._lock.release()
+		return u"\n".join(lines).encode("utf-8") + "\n"
+
+	def _sample(self, name, labels, value):
+		if labels:
+			name += "{%s}" % ",".join('%s="%s"' % (label, escape(labelvalue))
+									  for label, labelvalue in labels)
+		return "%s %s" % (name, formatvalue(value))
+
+	def writetextfile(self, filename):
+		"""
+		Write the metrics for the node_exporter textfile collector.
+
+		The file is written under a temporary name and renamed, so the
+		collector never reads a partial file.
+
+		"""
+		tmpfilename = "%s.%i.tmp" % (filename, os.getpid())
+		textfile = open(tmpfilename, "wb")
+		try:
+			textfile.write(self.render())
+		finally:
+			textfile.close()
+		if os.name == "nt" and os.path.exists(filename):
+			# Windows can't rename over an existing file
+			os.remove(filename)
+		os.rename(tmpfilename, filename)
+
+
+class MetricsServer(object):
+
+	""" Serve the metrics over HTTP (GET /metrics) in a background thread """
+
+	def __init__(self, metrics, port, host="127.0.0.1"):
+		class Handler(BaseHTTPRequestHandler):
+
+			def do_GET(self):
+				if self.path.split("?")[0] not in ("/", "/metrics"):
+					self.send_error(404)
+					return
+				body = metrics.render()
+				self.send_response(200)
+				self.send_header("Content-Type",
+								 "text/plain; version=0.0.4; charset=utf-8")
+				self.send_header("Content-Length", str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, format, *args):
+				pass
+
+		self.httpd = HTTPServer((host, port), Handler)
+		# handle_request() returns after the timeout if there is no request,
+		# so the serving thread notices close() (serve_forever() can't be
+		# stopped before Python 2.6)
+		self.httpd.socket.settimeout(.25)
+		self._serving = True
+		self._thread = threading.Thread(target=self._serve)
+		self._thread.setDaemon(True)
+		self._thread.start()
+
+	def _serve(self):
+		while self._serving:
+			self.httpd.handle_request()
+
+	def close(self):
+		""" Stop serving and close the listening socket """
+		self._serving = False
+		self._thread.join()
+		self.httpd.server_close()
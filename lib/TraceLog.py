@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+from thread import allocate_lock, get_ident
+from timeit import default_timer
+import os
+import threading
+try:
+	import json
+except ImportError:
+	# Python 2.5
+	json = None
+
+# The active trace log (if any), so code without access to the OPIparser
+# instance (e.g. worker threads in util_image) can add events
+_current = None
+
+
+def getcurrent():
+	return _current
+
+
+def setcurrent(tracelog):
+	global _current
+	_current = tracelog
+
+
+class TraceLog(object):
+
+	"""
+	Recorder for Chrome trace events.
+
+	Events are kept in memory and written by close() as a JSON file which
+	can be opened in chrome://tracing or the Perfetto UI. begin() and end()
+	must be properly nested per thread. Timestamps are in microseconds
+	since the trace log was created.
+
+	"""
+
+	def __init__(self, filename):
+		self.filename = filename
+		self.events = []
+		self._lock = allocate_lock()
+		self._pid = os.getpid()
+		self._start = default_timer()
+		self._threads = {}
+
+	def _add(self, event):
+		tid = get_ident()
+		event["ts"] = (default_timer() - self._start) * 1000000
+		event["pid"] = self._pid
+		event["tid"] = tid
+		self._lock.acquire()
+		try:
+			if not tid in self._threads:
+				self._threads[tid] = threading.currentThread().getName()
+			self.events.append(event)
+		finally:
+			self._lock.release()
+
+	def begin(self, name, cat = "", **args):
+		self._add({"name": name, "cat": cat, "ph": "B", "args": args})
+
+	def end(self, name, cat = "", **args):
+		self._add({"name": name, "cat": cat, "ph": "E", "args": args})
+
+	def instant(self, name, cat = "", **args):
+		self._add({"name": name, "cat": cat, "ph": "i", "s": "t",
+				   "args": args})
+
+	def counter(self, name, **values):
+		self._add({"name": name, "ph": "C", "args": values})
+
+	def threadname(self, name):
+		""" Set the name shown for the calling thread """
+		self._lock.acquire()
+		try:
+			self._threads[get_ident()] = name
+		finally:
+			self._lock.release()
+
+	def close(self):
+		if not json:
+			raise ImportError("Trace files need Python 2.6 or newer")
+		self._lock.acquire()
+		try:
+			events = [{"name": "thread_name", "ph": "M", "pid": self._pid,
+					   "tid": tid, "args": {"name": name}}
+					  for tid, name in self._threads.iteritems()]
+			events.extend(self.events)
+		finally:
+			self._lock.release()
+		tracefile = open(self.filename, "wb")
+		try:
+			json.dump({"traceEvents": events, "displayTimeUnit": "ms"},
+					  tracefile)
+		finally:
+			tracefile.close()
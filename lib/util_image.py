@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+import inspect
+import math
+import sys
+import threading
+
+from PIL import Image, ImageChops
+
+from TraceLog import getcurrent as gettracelog
+
+# Whether Image.resize() accepts a (fractional) source box (Pillow >= 4.3)
+try:
+	RESIZE_BOX = "box" in inspect.getargspec(Image.Image.resize)[0]
+except TypeError:
+	RESIZE_BOX = False
+
+def getbands(height, count, minheight=64):
+	"""
+	Split a height into up to count horizontal bands.
+
+	Bands are at least minheight rows high (except if the height is smaller).
+	Returns a list of (y0, y1) tuples.
+
+	"""
+	count = max(1, min(count, height // max(minheight, 1)))
+	bands = []
+	for i in xrange(count):
+		bands.append((height * i // count, height * (i + 1) // count))
+	return bands
+
+
+def threadmap(func, items, workers):
+	"""
+	Call func for each item using a pool of worker threads.
+
+	Returns the results in the order of items. The first exception raised
+	by func is re-raised in the calling thread.
+
+	"""
+	items = list(items)
+	results = [None] * len(items)
+	if workers < 2 or len(items) < 2:
+		for i, item in enumerate(items):
+			results[i] = func(item)
+		return results
+	errors = []
+	lock = threading.Lock()
+	queue = range(len(items))
+	queue.reverse()
+	tracelog = gettracelog()
+	def worker():
+		while not errors:
+			lock.acquire()
+			try:
+				if not queue:
+					break
+				i = queue.pop()
+			finally:
+				lock.release()
+			if tracelog:
+				tracelog.begin(func.__name__, "worker", item=repr(items[i]))
+			try:
+				results[i] = func(items[i])
+			except:
+				errors.append(sys.exc_info())
+			if tracelog:
+				tracelog.end(func.__name__, "worker")
+	threads = []
+	for i in xrange(min(workers, len(items))):
+		thread = threading.Thread(target=worker)
+		thread.start()
+		threads.append(thread)
+	for thread in threads:
+		thread.join()
+	if errors:
+		raise errors[0][0], errors[0][1], errors[0][2]
+	return results
+
+
+def cmsapply_tiled(transform, image, workers, minheight=64):
+	"""
+	Apply an ImageCms transform to horizontal bands of an image in parallel.
+
+	lcms releases the GIL while converting, so the bands are converted
+	concurrently. Each band is pasted into a single output image allocated
+	up front.
+
+	"""
+	bands = getbands(image.size[1], workers * 4, minheight)
+	if workers < 2 or len(bands) < 2:
+		return transform.apply(image)
+	image.load()
+	# PIL 1.1.7 only has outputMode
+	out = Image.new(getattr(transform, "output_mode", None) or
+					transform.outputMode, image.size)
+	def convert(band):
+		box = (0, band[0], image.size[0], band[1])
+		out.paste(transform.apply(image.crop(box)), box)
+	threadmap(convert, bands, workers)
+	return out
+
+
+def resize(image, size, resample, box=None):
+	"""
+	Resize an image, optionally from a source box.
+
+	The box is only passed on to Image.resize() if it is not the whole
+	image, so this also works with PIL versions which do not support it.
+
+	"""
+	if box is None or tuple(box) == (0, 0) + image.size:
+		return image.resize(size, resample)
+	return image.resize(size, resample, tuple(box))
+
+
+def resize_parallel(image, size, resample, workers, box=None, minheight=64):
+	"""
+	Resize an image (or a source box of it) using a pool of worker threads.
+
+	The antialiasing filter is separable and PIL applies it as a horizontal
+	pass followed by a vertical pass. In the horizontal pass every output
+	row only depends on the same source row, and in the vertical pass every
+	output column only depends on the same column of the intermediate
+	image. So the image is resized horizontally in bands of rows, then
+	vertically in strips of columns, and no band needs to overlap its
+	neighbours by the filter support. The result is pixel-identical to a
+	single resize() call, as Pillow always does the horizontal pass first.
+	PIL 1.1.7 chooses the pass order by the size of the intermediate image,
+	so the result would differ slightly there. The passes also need the
+	source box, so without it (Pillow < 4.3) this falls back to a single
+	resize() call.
+
+	If a source box is given, the horizontal pass only processes the rows
+	within reach of the vertical filter, and both passes use the same box
+	coordinates as a single resize() call would.
+
+	The box filter (if available) is handled the same way. Other filters
+	and modes fall back to a single resize() call.
+
+	"""
+	if (workers < 2 or not RESIZE_BOX or
+		resample not in (Image.ANTIALIAS, getattr(Image, "BOX", None)) or
+		image.mode not in ("L", "RGB", "CMYK")):
+		return resize(image, size, resample, box)
+	image.load()
+	width, height = image.size
+	if box is None:
+		box = (0, 0, width, height)
+	if size[0] != width or box[0] or box[2] != width:
+		# Horizontal pass
+		temp = Image.new(image.mode, (size[0], height))
+		# The antialias filter support is 3 source pixels, scaled when
+		# reducing
+		support = 3.0 * max(1.0, float(box[3] - box[1]) / size[1])
+		top = max(0, int(box[1] - support) - 1)
+		bottom = min(height, int(math.ceil(box[3] + support)) + 1)
+		def resize_rows(band):
+			band = (0, top + band[0], width, top + band[1])
+			rows = band[3] - band[1]
+			temp.paste(resize(image.crop(band), (size[0], rows), resample,
+							  (box[0], 0, box[2], rows)),
+					   (0, band[1]))
+		threadmap(resize_rows, getbands(bottom - top, workers * 4,
+										minheight),
+				  workers)
+	else:
+		temp = image
+	if size[1] != height or box[1] or box[3] != height:
+		# Vertical pass
+		out = Image.new(image.mode, size)
+		def resize_columns(strip):
+			columns = strip[1] - strip[0]
+			strip = (strip[0], 0, strip[1], height)
+			out.paste(resize(temp.crop(strip), (columns, size[1]), resample,
+							 (0, box[1], columns, box[3])),
+					  (strip[0], 0))
+		threadmap(resize_columns, getbands(size[0], workers * 4, minheight),
+				  workers)
+	else:
+		out = temp
+	return out
+
+
+def reduce_resize(image, size, resample, workers, box=None, minheight=64):
+	"""
+	Resize in two stages: box-reduce by the largest integer factor first,
+	then resample the remaining fractional step with resample.
+
+	The cost of the antialias filter grows with the reduction factor, as
+	its support is 3 source pixels scaled by the factor. Per output pixel
+	and pass it reads about 6 * factor source pixels, e.g. 48 for a factor
+	of 8 (2400 -> 300 dpi). The box filter reads about factor source pixels
+	per output pixel and pass, and the remaining step is less than 2, so
+	the two stages together read about factor + 12 (20 for a factor of 8).
+	The result is slightly softer than a single antialias resize.
+
+	Both stages resample the same source box, so the geometry is the same
+	as with a single resize(). Needs the box filter (Pillow >= 3.4),
+	otherwise falls back to a single resize.
+
+	"""
+	if box is None:
+		box = (0, 0) + image.size
+	width = box[2] - box[0]
+	height = box[3] - box[1]
+	factor = int(min(width / size[0], height / size[1]))
+	if (factor < 2 or not hasattr(Image, "BOX") or resample == Image.BOX or
+		image.mode not in ("L", "RGB", "CMYK")):
+		return resize_parallel(image, size, resample, workers, box, minheight)
+	reduced = resize_parallel(image, (max(int(round(width / factor)), size[0]),
+									  max(int(round(height / factor)),
+										  size[1])),
+							  Image.BOX, workers, box, minheight)
+	return resize_parallel(reduced, size, resample, workers, None, minheight)
+
+
+def channels_equal(image, minheight=64):
+	"""
+	Check if all channels of an image are identical.
+
+	The image is compared in bands of minheight rows, using
+	ImageChops.difference() and getbbox() on the channels of each band, so
+	only band-sized copies are made. Stops at the first band which differs.
+
+	"""
+	if len(image.getbands()) < 2:
+		return True
+	width, height = image.size
+	for band in getbands(height, max(1, height // max(minheight, 1)),
+						 minheight):
+		channels = image.crop((0, band[0], width, band[1])).split()
+		for channel in channels[1:]:
+			if ImageChops.difference(channels[0], channel).getbbox():
+				return False
+	return True
+
+
+def load_region(image, box):
+	"""
+	Load only the strips or tiles of an image which intersect box.
+
+	Works for images which are not loaded yet and whose decoder tile list
+	has more than one entry (e.g. striped or tiled TIFF). Pixels outside
+	the loaded strips or tiles are left blank. Returns True if the tile
+	list was restricted, False if the image was left untouched.
+
+	"""
+	tile = getattr(image, "tile", None)
+	if not tile or len(tile) < 2:
+		return False
+	tiles = [item for item in tile if item[1][0] < box[2] and
+									  item[1][2] > box[0] and
+									  item[1][1] < box[3] and
+									  item[1][3] > box[1]]
+	if len(tiles) == len(tile):
+		return False
+	image.tile = tiles
+	image.load()
+	return True
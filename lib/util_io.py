@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+from time import time
+
+
+class OutputBuffer(object):
+
+	"""
+	Write buffer which coalesces small writes.
+
+	Writes are collected until bufsize bytes are pending or flush() is
+	called, and then written to the file descriptor in one go. Writes of
+	bufsize bytes or more are written as they are, without joining them
+	with the pending small writes, so large payloads are not copied.
+
+	"""
+
+	def __init__(self, fileobj, bufsize=1024 * 1024):
+		self.fileobj = fileobj
+		self.bufsize = bufsize
+		self.bytes = 0
+		self.writes = 0
+		# Byte ranges copied from input files with copyrange()
+		self.copied = 0
+		self.copytime = 0.0
+		self._pending = []
+		self._size = 0
+		try:
+			self._fd = fileobj.fileno()
+		except (AttributeError, IOError, ValueError):
+			self._fd = None
+		else:
+			# Anything the file object has buffered goes first
+			fileobj.flush()
+
+	def write(self, data):
+		if not data:
+			return
+		if len(data) < self.bufsize and not isinstance(data, str):
+			# Only keep views (e.g. of a memory map) for large writes
+			data = str(data)
+		self._pending.append(data)
+		self._size += len(data)
+		if self._size >= self.bufsize:
+			self.flush()
+
+	def flush(self):
+		pending = self._pending
+		if not pending:
+			return
+		self._pending = []
+		self.bytes += self._size
+		self._size = 0
+		# Join the small writes, but do not copy large payloads
+		small = []
+		for data in pending:
+			if len(data) >= self.bufsize:
+				if small:
+					self._write("".join(small))
+					small = []
+				self._write(data)
+			else:
+				small.append(data)
+		if small:
+			self._write("".join(small))
+		if self._fd is None:
+			self.fileobj.flush()
+
+	def copyrange(self, fd, offset, count, view=None):
+		"""
+		Copy count bytes at offset of the input file descriptor fd.
+
+		Writes view (e.g. a buffer of a memory map) if given, so the data
+		is not copied, or reads and writes the range in chunks of bufsize.
+
+		"""
+		self.flush()
+		start = time()
+		end = offset + count
+		if view is not None:
+			self._write(view)
+		else:
+			while offset < end:
+				os.lseek(fd, offset, 0)
+				data = os.read(fd, min(max(self.bufsize, 65536), end - offset))
+				if not data:
+					break
+				self._write(data)
+				offset += len(data)
+		if self._fd is None:
+			self.fileobj.flush()
+		self.bytes += count
+		self.copied += count
+		self.copytime += time() - start
+
+	def tell(self):
+		""" Number of bytes written so far, including pending writes """
+		return self.bytes + self._size
+
+	def getcopystats(self):
+		if self.copytime:
+			rate = self.copied / 1024.0 / 1024.0 / self.copytime
+		else:
+			rate = 0
+		return ("%i bytes passed through in %.2f s (%.1f MB/s)" %
+				(self.copied, self.copytime, rate))
+
+	def _write(self, data):
+		if self._fd is None:
+			self.fileobj.write(data)
+			self.writes += 1
+			return
+		while data:
+			written = os.write(self._fd, data)
+			self.writes += 1
+			# A buffer, so the rest of a large write is not copied
+			data = buffer(data, written)
+
+
+class MappedInput(object):
+
+	"""
+	Read-only memory map of an input file.
+
+	Can be searched with find() and rfind() and sliced like a string.
+	view() returns a part of the file without copying it.
+
+	"""
+
+	def __init__(self, filename):
+		self.name = filename
+		self._file = open(filename, "rb")
+		try:
+			self._map = mmap.mmap(self._file.fileno(), 0,
+								  access=mmap.ACCESS_READ)
+		except:
+			self._file.close()
+			raise
+
+	def __len__(self):
+		return len(self._map)
+
+	def __getitem__(self, index):
+		return self._map[index]
+
+	def __iter__(self):
+		pos = 0
+		size = len(self._map)
+		while pos < size:
+			end = self._map.find("\n", pos) + 1 or size
+			yield self._map[pos:end]
+			pos = end
+
+	def close(self):
+		self._map.close()
+		self._file.close()
+
+	def fileno(self):
+		return self._file.fileno()
+
+	def find(self, sub, start=0, end=None):
+		if end is None:
+			end = len(self._map)
+		return self._map.find(sub, start, end)
+
+	def rfind(self, sub, start=0, end=None):
+		if end is None:
+			end = len(self._map)
+		return self._map.rfind(sub, start, end)
+
+	def view(self, start, end):
+		return buffer(self._map, start, end - start)
@@ -23,20 +23,24 @@
 
 # Standard library imports
 from codecs import BOM_UTF8
+from cStringIO import StringIO
 from decimal import Decimal
 from difflib import get_close_matches
 from hashlib import md5
 from os import fdopen, listdir, mkdir, path, stat
-from tempfile import gettempdir
-from thread import start_new_thread
+from thread import allocate_lock, start_new_thread
 from time import gmtime, strftime, time
 import binascii
+import cProfile
 import imghdr
 import math
 import os
+import pstats
 import re
+import sqlite3
 import struct
 import sys
+import threading
 import traceback
 if sys.platform == 'win32':
 	import msvcrt
@@ -54,7 +58,16 @@ import wx
 
 # Custom modules
 from lib.ICCProfile import ICCProfile
+from lib.JobStats import JobStats
+from lib.LogQueue import DEBUG, ERROR, INFO, WARNING, LogQueue, levels
 from lib.LogWindow import LogWindow
+from lib.MemProfiler import MemProfiler
+from lib.Metrics import Metrics, MetricsServer
+from lib.ordereddict import OrderedDict
+from lib.TraceLog import TraceLog, setcurrent
+from lib.util_io import MappedInput, OutputBuffer
+from lib.util_image import (RESIZE_BOX, channels_equal, cmsapply_tiled,
+							load_region, reduce_resize, resize_parallel)
 from lib.util_str import safe_str, safe_unicode
 
 
@@ -77,6 +90,9 @@ class OPIparser:
 		self.build = strftime("%Y-%m-%d %H:%I:%S",
 							  gmtime(os.stat(sys.argv[0]).st_mtime))
 		self.console = None
+		self._loglevel = INFO
+		self._logqueue = None
+		self._log = None
 		self.verbose = False
 		self.abortonerror = True
 		self.abortonfilenotfound = True
@@ -95,18 +111,41 @@ class OPIparser:
 		self.intent = "p"
 		self.hirespath = ""
 		self.lorespath = ""
+		self.consolelines = 10000
 		self.log = ""
+		self.loglevel = "info"
 		self.mode = "b"
 		self.newline = "\n"
 		self.usecache = True
 		self.cachemegs = 256
 		self.usediskcache = False
+		self.pyramidcache = ""
+		self.transformlist = ""
+		self.imageinfocachefile = ""
+		self._imageinfocache = None
+		self.report = ""
+		self._stats = JobStats()
+		self.trace = ""
+		self._tracelog = None
+		self.profile = ""
+		self.profilefile = ""
+		self._profiler = None
+		self.metricsfile = ""
+		self.metricsport = 0
+		self._metrics = None
+		self._metricsserver = None
+		self.warmup = False
+		self._warmupthread = None
+		self.workers = 1
+		self.outputbuffersize = 1024 * 1024
+		self.mmapinput = True
 		self.version = [1.3, 2.0]
 		self.imagecropthreshold = 1.1
 		
 		self.ColorImageDownsampleFilter = Image.ANTIALIAS
 		self.GrayImageDownsampleFilter = Image.ANTIALIAS
 		self.MonoImageDownsampleFilter = Image.ANTIALIAS
+		self.fastdownsample = False
 					
 		self.DownsampleMonoImages = True
 		self.MonoImageMinResolution = 800.0
@@ -132,7 +171,11 @@ class OPIparser:
 		self._imagecache = {}
 		self._cachebytes = 0
 		self._max_occurrences = []
-		self._transforms = {}
+		self._transforms = TransformCache()
+		self._transformrecipes = []
+		self._transformlock = allocate_lock()
+		self._cmsprofiles = {}
+		self._embeddedprofiles = {}
 		
 		# Example cmyk color definition with "Composite CMYK" / "Composite
 		# Unchanged" (QuarkXPress 6.5 / 7):
@@ -197,6 +240,7 @@ class OPIparser:
 		self._timestamp = time()
 		self._stdin = None
 		self._stdout = None
+		self._out = None
 		self.errorcount = 0
 		self.msgwindow = None
 		self.frame = None
@@ -206,6 +250,11 @@ class OPIparser:
 		self._imagecached = None
 		self._sizemod = None
 		self._colormod = None
+		self._reduced = None
+		self._unreduced = None
+		self._imageinfo = {}
+		self._imageinfopath = None
+		self._imageplan = None
 		self._iscmykgrayimage = None
 		self._bgcolor = None
 		self._errorstr = ""
@@ -253,27 +302,48 @@ class OPIparser:
 		self._OPIobjectcount = 0
 		self._BeginDocument = None
 
-	def msg(self, txt, timestamp = True):
+	def msg(self, txt, timestamp = True, level = None, args = ()):
+		""" Log a message. Without an explicit level, messages starting
+		with "ERROR" or "WARNING" get that level, all others INFO. Formatting
+		(timestamp, txt % args) and writing is left to the log writer
+		thread while a job runs. """
+		if level is None:
+			if txt.startswith("ERROR"):
+				level = ERROR
+			elif txt.startswith("WARNING"):
+				level = WARNING
+			else:
+				level = INFO
+		if level < self._loglevel:
+			return
+		if self._logqueue:
+			self._logqueue.put(time(), txt, args, timestamp)
+		else:
+			self._writelog([self._formatlog(time(), txt, args, timestamp)])
+	
+	def debug(self, txt, *args):
+		""" Log a message (txt % args) if the log level is debug """
+		if self._loglevel <= DEBUG:
+			self.msg(txt, True, DEBUG, args)
+	
+	def _formatlog(self, created, txt, args, timestamp):
+		if args:
+			txt = txt % args
 		if timestamp:
-			s = time() - self._timestamp
-			h = int(math.floor(s / 60 / 60))
-			m = int(math.floor(s / 60))
-			m -= h * 60
-			s = int(round(s - (h * 60 * 60) - (m * 60)))
-			if s >= 60:
-				s -= 60
-				m += 1
-			if m >= 60:
-				m -= 60
-				h += 1
-			txt = (str(h).zfill(2) + ":" + str(m).zfill(2) + ":" +
-				   str(s).zfill(2) + " " + txt)
-		self.console.write(txt)
+			h, s = divmod(int(round(created - self._timestamp)), 60 * 60)
+			m, s = divmod(s, 60)
+			txt = "%02i:%02i:%02i %s" % (h, m, s, txt)
+		return txt
+	
+	def _writelog(self, lines):
+		if self.console:
+			self.console.writelines(lines)
 		if self._fo != self._stdout:
-			print txt.encode("utf-8", "backslashreplace")
-		if self.log:
-			self._log.write(txt.encode("utf-8", "backslashreplace") +
-							self.newline)
+			print "\n".join(line.encode("utf-8", "backslashreplace")
+							for line in lines)
+		if self._log:
+			self._log.write("".join(line.encode("utf-8", "backslashreplace") +
+									self.newline for line in lines))
 			
 	def escapefilename(self, filename = None):
 		if not filename:
@@ -327,10 +397,11 @@ class OPIparser:
 														 1024.0 / 1024.0) *
 														100) / 100.0))))
 		self.msg("_max_occurrences " + str(self._max_occurrences))
+		self.msg("_transforms: " + self._transforms.getstats())
 		
 	def _raw_write(self, data):
 		if not self._aborted:
-			self._fo.write(data)
+			self._out.write(data)
 	
 	def parse(self, fi, fo):
 		
@@ -341,6 +412,12 @@ class OPIparser:
 			else:
 				tty.setraw(sys.stdin.fileno())
 				self._stdin = self._fi = fdopen(0, "rb")
+		elif self.mmapinput:
+			try:
+				self._fi = MappedInput(fi)
+			except (EnvironmentError, ValueError), v:
+				# e.g. empty file
+				self._fi = open(fi, "rb")
 		else:
 			self._fi = open(fi, "rb")
 		
@@ -353,17 +430,37 @@ class OPIparser:
 				self._stdout = self._fo = fdopen(1, "wb")
 		else:
 			self._fo = open(fo, "wb")
+		self._out = OutputBuffer(self._fo, self.outputbuffersize)
 		
-		self.console = LogWindow("pyOPI build " + str(self.build), (600, 600), "")
+		self.console = LogWindow("pyOPI build " + str(self.build), (600, 600), "",
+								 self.consolelines)
 		start_new_thread(self.main, ())
 		self.console.Show()
 		self.wxApp.MainLoop()
 		
 	def main(self):
+		done = False
 		try:
 			if self.log:
 				self._log = open(self.log, "wb")
 				self._log.write(BOM_UTF8)
+			self._loglevel = levels.get(self.loglevel.lower(), INFO)
+			if self.verbose:
+				self._loglevel = min(self._loglevel, DEBUG)
+			self._logqueue = LogQueue(self._formatlog, [self._writelog])
+			if self.trace:
+				self._tracelog = TraceLog(self.trace)
+				self._tracelog.threadname("main")
+				self._tracelog.begin("main", "job")
+				setcurrent(self._tracelog)
+			if self.metricsfile or self.metricsport:
+				self._initmetrics()
+			if self.profile == "cpu":
+				# Profiles this thread, i.e. the rest of main()
+				self._profiler = cProfile.Profile()
+				self._profiler.enable()
+			elif self.profile == "mem":
+				self._profiler = MemProfiler()
 			self.msg("pyOPI build " + str(self.build), False)
 			self.msg("Commandline options:", False)
 			self.msg(self.newline.join(sys.argv[1:]) + self.newline, False)
@@ -374,94 +471,32 @@ class OPIparser:
 		
 			for key in self.ICCProfiles:
 				if self.ICCProfiles[key].fileName:
-					self.ICCProfiles[key].__init__(self.ICCProfiles[key].fileName)
+					# Only read the header, tags are loaded when needed
+					self.ICCProfiles[key].__init__(self.ICCProfiles[key].fileName,
+												   load=False)
+			if self.warmup:
+				# Build transforms in the background while the prolog
+				# is passed through
+				self._warmupthread = threading.Thread(target=self._warmup)
+				self._warmupthread.setDaemon(True)
+				self._warmupthread.start()
+			elif self.transformlist:
+				self._prebuildtransforms()
+			if self.imageinfocachefile:
+				try:
+					self._imageinfocache = ImageInfoCache(self.imageinfocachefile)
+				except Exception, v:
+					self.msg("WARNING - could not open image info cache: " +
+							 safe_str(v))
 			
 			self._reset()
 			self._parsemode = None
-			for line in self._fi:
-				while line:
-					if self._terminated: break
-					if not self._object:
-						if self._parsemode != "a":
-							self._parsemode = "a"
-							if self.verbose:
-								self.msg("Parsemode: Analyze" + self.newline)
-						if not self._BeginOPI:
-							i = line.find("%ALD")
-							if i < 0: i = line.find("%%BeginOPI")
-						else:
-							i = line.find("%")
-						if i >= 0:
-							if i > 0:
-								if not self._BeginOPI:
-									self._raw_write(line[0:i])
-								elif not self._BeginIncludedImage:
-									self._cache(line[0:i])
-									gfxstate = line[0:i].rstrip().splitlines()
-									self._gfxstate += gfxstate
-									self._original_gfxstate += gfxstate
-									if self.verbose:
-										self.msg("Cached GFX state: " +
-												 self.newline.join(line[0:i].rstrip().splitlines()))
-								line = line[i:]
-							
-							i = None
-							r = line.find("\r")
-							rn = line.find("\r\n")
-							if r >= 0 and rn >= 0:
-								if r < rn: i = r
-								else: i = rn + 1
-							elif r >= 0: i = r
-							elif rn >= 0: i = rn + 1
-							
-							if i >= 0:
-								self._parse(line[0:i+1])
-								line = line[i+1:]
-								
-							else:
-								self._parse(line)
-								break
-						else:
-							if not self._BeginOPI:
-								self._raw_write(line)
-							elif not self._BeginIncludedImage:
-								self._cache(line)
-								gfxstate = line.rstrip().splitlines()
-								self._gfxstate += gfxstate
-								self._original_gfxstate += gfxstate
-								if self.verbose:
-									self.msg("Cached GFX state: " +
-											 self.newline.join(line.rstrip().splitlines()))
-							break
-					else:
-						if self._parsemode != "p":
-							self._parsemode = "p"
-							if self.verbose:
-								if not self._BeginIncludedImage:
-									self.msg("Parsemode: Pass-through")
-								else:
-									self.msg("Parsemode: Discard")
-						i = line.find("%%End")
-						if i < 0: i = line.find("%End")
-						if i >= 0:
-							i = line.find('%%End' + self._object)
-							if i < 0:
-								i = line.find('%End' + self._object.lower())
-						if i >= 0:
-							if self.verbose:
-								self.msg('%%End' + self._object)
-								self.msg("", False)
-							self._object = None
-							self._BeginDocument = None
-							if not self._BeginIncludedImage:
-								self._raw_write(line[0:i])
-							line = line[i:]
-						else:
-							if not self._BeginIncludedImage:
-								self._raw_write(line)
-							break
+			self._stats = JobStats(self._tracelog)
+			for line in self._lines():
+				self._processline(line)
 				if self._terminated: break
 			self._fi.close()
+			self._out.flush()
 			if self._fo != self._stdout:
 				self._fo.close()
 			if self._aborted:
@@ -480,12 +515,329 @@ class OPIparser:
 				self.msg("Done. " + str(self.errorcount) + " ERROR(s) occured.")
 			else:
 				self.msg("Done.")
-			if self.log:
-				self._log.close()
-			if self.errorcount == 0 and not self._aborted:
-				self.wxApp.ExitMainLoop()
+			self.msg("Transform cache: " + self._transforms.getstats())
+			if self._out.copied:
+				self.msg("Pass-through: " + self._out.getcopystats())
+			if self.verbose:
+				self.msg("Output: %i bytes in %i write(s)" % (self._out.bytes,
+															  self._out.writes))
+			self.msg(self.newline.join(self._stats.summary(self.verbose)) +
+					 self.newline, False)
+			if self.report:
+				try:
+					self._stats.write(self.report)
+				except Exception, v:
+					self.msg("WARNING - could not write report: " +
+							 safe_str(v))
+			if self._tracelog:
+				self._closetrace()
+			if self._profiler:
+				self._closeprofile()
+			if self._metrics:
+				if self._aborted:
+					status = "aborted"
+				elif self.errorcount:
+					status = "error"
+				else:
+					status = "ok"
+				self._metrics.inc("opi_jobs_total", status=status)
+				self._updatemetrics()
+			if self.transformlist and not self._aborted:
+				if self._warmupthread:
+					# Don't save while the warm-up is still adding transforms
+					self._warmupthread.join()
+				self._savetransformlist()
+			if self._imageinfocache:
+				self._imageinfocache.close()
+			done = self.errorcount == 0 and not self._aborted
 		except Exception, v:
 			self.msg("ERROR - unhandled exception: " + traceback.format_exc())
+			if self._tracelog:
+				# Keep the trace of what happened up to here
+				self._closetrace()
+		finally:
+			if self._out:
+				# Write what is still pending, e.g. after an unhandled
+				# exception (after a normal run, nothing is left)
+				try:
+					self._out.flush()
+				except Exception, v:
+					self.msg("ERROR - could not write output: " + safe_str(v))
+			if self._metricsserver:
+				# Free the port for the next job
+				try:
+					self._metricsserver.close()
+				except Exception, v:
+					self.msg("WARNING - could not stop metrics server: " +
+							 safe_str(v))
+				self._metricsserver = None
+			if self._logqueue:
+				# Write what is still queued, e.g. the traceback of an
+				# unhandled exception
+				self._logqueue.close()
+				self._logqueue = None
+			if self._log:
+				self._log.close()
+				self._log = None
+		if done:
+			self.wxApp.ExitMainLoop()
+	
+	def _closetrace(self):
+		self._tracelog.end("main", "job")
+		setcurrent(None)
+		try:
+			self._tracelog.close()
+		except Exception, v:
+			self.msg("WARNING - could not write trace file: " + safe_str(v))
+		self._tracelog = None
+	
+	def _closeprofile(self):
+		""" Stop profiling and log (and for cpu, save) the results """
+		if self.profile == "cpu":
+			self._profiler.disable()
+			filename = self.profilefile
+			if not filename:
+				filename = path.splitext(self.log or self._fo.name)[0] + ".pstats"
+			try:
+				self._profiler.dump_stats(filename)
+			except Exception, v:
+				self.msg("WARNING - could not write profile: " + safe_str(v))
+			else:
+				self.msg("CPU profile written to " + safe_unicode(filename))
+			stream = StringIO()
+			stats = pstats.Stats(self._profiler, stream=stream)
+			stats.sort_stats("cumulative").print_stats(20)
+			self.msg(stream.getvalue(), False)
+		else:
+			self.msg(self.newline.join(self._profiler.report()) + self.newline,
+					 False)
+			self._profiler.close()
+		self._profiler = None
+	
+	def _cacheevent(self, name, **args):
+		""" Record an image cache event in the trace and the metrics """
+		if self._tracelog:
+			self._tracelog.instant(name, "cache", **args)
+			self._tracelog.counter("Image cache",
+								   MB=self._cachebytes / 1024.0 / 1024.0)
+		if self._metrics:
+			if name == "cache hit":
+				self._metrics.inc("opi_image_cache_hits_total",
+								  cache=args["source"])
+			elif name == "pyramid hit":
+				self._metrics.inc("opi_image_cache_hits_total", cache="pyramid")
+			elif name == "cache evict":
+				self._metrics.inc("opi_image_cache_evictions_total")
+				self._metrics.inc("opi_image_cache_evicted_bytes_total",
+								  args["bytes"])
+	
+	def _initmetrics(self):
+		self._metrics = metrics = Metrics()
+		metrics.counter("opi_jobs_total", "Jobs processed")
+		metrics.counter("opi_errors_total", "Errors")
+		metrics.counter("opi_images_total", "Images inserted")
+		metrics.counter("opi_image_bytes_read_total",
+						"Bytes read from image files")
+		metrics.counter("opi_bytes_out_total", "Bytes written to the output")
+		metrics.counter("opi_image_cache_hits_total", "Image cache hits")
+		metrics.counter("opi_image_cache_misses_total",
+						"Images read from the original file")
+		metrics.counter("opi_image_cache_evictions_total",
+						"Images purged from the memory cache")
+		metrics.counter("opi_image_cache_evicted_bytes_total",
+						"Bytes purged from the memory cache")
+		metrics.gauge("opi_image_cache_bytes", "Memory cache size in bytes")
+		metrics.gauge("opi_image_cache_entries", "Images in the memory cache")
+		metrics.gauge("opi_transform_cache_size", "Cached color transforms")
+		metrics.counter("opi_transform_cache_hits_total",
+						"Transform cache hits")
+		metrics.counter("opi_transform_cache_misses_total",
+						"Transform cache misses")
+		metrics.counter("opi_transform_cache_evictions_total",
+						"Transform cache evictions")
+		metrics.histogram("opi_stage_duration_seconds",
+						  "Wall time per image processing stage")
+		metrics.histogram("opi_image_duration_seconds",
+						  "Wall time per image")
+		if self.metricsport:
+			try:
+				self._metricsserver = MetricsServer(metrics, self.metricsport)
+			except Exception, v:
+				self.msg("WARNING - could not start metrics server: " +
+						 safe_str(v))
+			else:
+				self.msg("Metrics at http://127.0.0.1:%i/metrics" %
+						 self.metricsport)
+	
+	def _updatemetrics(self, imagestats = None):
+		""" Update the metrics after an image (if given), and write the
+		textfile if one is set """
+		metrics = self._metrics
+		if imagestats:
+			if self._imageformat == "epsf":
+				mode = ""
+			else:
+				mode = self._getimage().mode
+			metrics.inc("opi_images_total", format=self._imageformat,
+						mode=mode)
+			if imagestats.bytesin:
+				metrics.inc("opi_image_bytes_read_total", imagestats.bytesin,
+							source=imagestats.cache)
+			metrics.inc("opi_bytes_out_total", imagestats.bytesout)
+			if imagestats.cache == "file":
+				metrics.inc("opi_image_cache_misses_total")
+			for stage in imagestats.wall:
+				metrics.observe("opi_stage_duration_seconds",
+								imagestats.wall[stage], stage=stage)
+			metrics.observe("opi_image_duration_seconds",
+							imagestats.totalwall())
+		metrics.set("opi_errors_total", self.errorcount)
+		metrics.set("opi_image_cache_bytes", self._cachebytes)
+		metrics.set("opi_image_cache_entries", len(self._imagecache))
+		metrics.set("opi_transform_cache_size", len(self._transforms))
+		metrics.set("opi_transform_cache_hits_total", self._transforms.hits)
+		metrics.set("opi_transform_cache_misses_total",
+					self._transforms.misses)
+		metrics.set("opi_transform_cache_evictions_total",
+					self._transforms.evictions)
+		if self.metricsfile:
+			try:
+				metrics.writetextfile(self.metricsfile)
+			except Exception, v:
+				self.msg("WARNING - could not write metrics: " + safe_str(v))
+	
+	def _lines(self):
+		""" Iterate over the input line by line. With memory mapped input,
+		stretches which are only passed through or discarded are skipped
+		ahead to the next DSC comment of interest in one go. """
+		if not isinstance(self._fi, MappedInput):
+			for line in self._fi:
+				yield line
+			return
+		pos = 0
+		size = len(self._fi)
+		while pos < size and not self._terminated:
+			end = self._skipahead(pos)
+			if end > pos:
+				pos = end
+				continue
+			end = self._fi.find("\n", pos) + 1 or size
+			yield self._fi[pos:end]
+			pos = end
+	
+	def _skipahead(self, pos):
+		""" Pass through or discard the lines from pos up to the line with
+		the next comment the parser is waiting for. Returns the new
+		position. """
+		if self._object:
+			tokens = ("%End", )
+		elif not self._BeginOPI:
+			tokens = ("%ALD", "%%BeginOPI")
+		else:
+			# Comments and graphics state are analyzed line by line
+			return pos
+		found = [i for i in [self._fi.find(token, pos) for token in tokens]
+				 if i >= 0]
+		if found:
+			end = self._fi.rfind("\n", pos, min(found)) + 1
+		else:
+			end = len(self._fi)
+		if end > pos and not (self._object and self._BeginIncludedImage):
+			if end - pos >= self._out.bufsize and not self._aborted:
+				# Large range, copy it without going through the buffer
+				if self._tracelog:
+					self._tracelog.begin("pass-through", "io",
+										 bytes=end - pos)
+				self._out.copyrange(self._fi.fileno(), pos, end - pos,
+									self._fi.view(pos, end))
+				if self._tracelog:
+					self._tracelog.end("pass-through", "io")
+			else:
+				self._raw_write(self._fi.view(pos, end))
+		return end
+	
+	def _processline(self, line):
+		while line:
+			if self._terminated: break
+			if not self._object:
+				if self._parsemode != "a":
+					self._parsemode = "a"
+					if self.verbose:
+						self.msg("Parsemode: Analyze" + self.newline)
+				if not self._BeginOPI:
+					i = line.find("%ALD")
+					if i < 0: i = line.find("%%BeginOPI")
+				else:
+					i = line.find("%")
+				if i >= 0:
+					if i > 0:
+						if not self._BeginOPI:
+							self._raw_write(line[0:i])
+						elif not self._BeginIncludedImage:
+							self._cache(line[0:i])
+							gfxstate = line[0:i].rstrip().splitlines()
+							self._gfxstate += gfxstate
+							self._original_gfxstate += gfxstate
+							if self.verbose:
+								self.msg("Cached GFX state: " +
+										 self.newline.join(line[0:i].rstrip().splitlines()))
+						line = line[i:]
+					
+					i = None
+					r = line.find("\r")
+					rn = line.find("\r\n")
+					if r >= 0 and rn >= 0:
+						if r < rn: i = r
+						else: i = rn + 1
+					elif r >= 0: i = r
+					elif rn >= 0: i = rn + 1
+					
+					if i >= 0:
+						self._parse(line[0:i+1])
+						line = line[i+1:]
+						
+					else:
+						self._parse(line)
+						break
+				else:
+					if not self._BeginOPI:
+						self._raw_write(line)
+					elif not self._BeginIncludedImage:
+						self._cache(line)
+						gfxstate = line.rstrip().splitlines()
+						self._gfxstate += gfxstate
+						self._original_gfxstate += gfxstate
+						if self.verbose:
+							self.msg("Cached GFX state: " +
+									 self.newline.join(line.rstrip().splitlines()))
+					break
+			else:
+				if self._parsemode != "p":
+					self._parsemode = "p"
+					if self.verbose:
+						if not self._BeginIncludedImage:
+							self.msg("Parsemode: Pass-through")
+						else:
+							self.msg("Parsemode: Discard")
+				i = line.find("%%End")
+				if i < 0: i = line.find("%End")
+				if i >= 0:
+					i = line.find('%%End' + self._object)
+					if i < 0:
+						i = line.find('%End' + self._object.lower())
+				if i >= 0:
+					if self.verbose:
+						self.msg('%%End' + self._object)
+						self.msg("", False)
+					self._object = None
+					self._BeginDocument = None
+					if not self._BeginIncludedImage:
+						self._raw_write(line[0:i])
+					line = line[i:]
+				else:
+					if not self._BeginIncludedImage:
+						self._raw_write(line)
+					break
 	
 	def _abort(self):
 		self._reset()
@@ -551,6 +903,8 @@ class OPIparser:
 					# Replace postscript character tags with ? character
 				keys[1] = self._pschartags.sub("?", keys[1])
 				self._ImageFileName = keys[1]
+				self._stats.begin(self._ImageFileName)
+				self._stats.stage("resolve")
 				
 				mac = 0
 				posix = 0
@@ -775,6 +1129,7 @@ class OPIparser:
 								self._imageformat = "[unknown]"
 					except IOerror:
 						self._imageformat = "[unknown - error while reading file]"
+					self._stats.stage(None)
 					self.msg("Image type: " + str(self._imageformat))
 					if self._imageformat not in self.supportedtypes:
 						if self.verbose:
@@ -1105,13 +1460,19 @@ class OPIparser:
 		_tmppath = path.join(cachedir,  self._invalidfnamechars.sub("_", fname))
 		return _tmppath
 	
+	def _needsgraydetection(self, mode=None):
+		if mode is None:
+			mode = self._getimage().mode
+		return (mode == "CMYK" and
+				self.detectcmykgrayimages and
+				(((self.convertcmykimages or self.convertgrayimages) and
+				  self.ICCProfiles["out"].fileName) or
+				 (self.convertgrayimages and
+				  self.ICCProfiles["out_gray"].fileName) or
+				 self.cmykgrayimages_stripcmy))
+	
 	def _detectcmykgrayimages(self):
-		if (self._getimage().mode == "CMYK" and self.detectcmykgrayimages and
-			(((self.convertcmykimages or self.convertgrayimages) and
-			  self.ICCProfiles["out"].fileName) or
-			 (self.convertgrayimages and
-			  self.ICCProfiles["out_gray"].fileName) or
-			 self.cmykgrayimages_stripcmy)):
+		if self._needsgraydetection():
 			# Detecting CMYK gray images only makes sense if:
 			#  - the image is CMYK (obviously)
 			#  - convertcmykimages is True and outprofile is set
@@ -1123,58 +1484,103 @@ class OPIparser:
 			#  - detectcmykgrayimages is True
 			
 			# Test for "K only" CMYK image
-			self.msg("Checking if CMYK image is really a grayscale image...")
-			# First test 5 pixels, if they are all equal, test the whole image
-			# 1   2
-			#   3
-			# 4   5
-			w, h = self._getimage().size
-			test1 = self._getimage().getpixel((w / 4, h / 4))
-			if test1[0] == test1[1] == test1[2] == 0:
-				test2 = self._getimage().getpixel(((w / 4) * 3, (h / 4)))
-				if test2[0] == test2[1] == test2[2] == 0:
-					test3 = self._getimage().getpixel((w / 2, h / 2))
-					if test3[0] == test3[1] == test3[2] == 0:
-						test4 = self._getimage().getpixel(((w / 4),
-														   (h / 4) * 3))
-						if test4[0] == test4[1] == test4[2] == 0:
-							test5 = self._getimage().getpixel(((w / 4) * 3,
-															   (h / 4) * 3))
-							if test5[0] == test5[1] == test5[2] == 0:
-								# Get channels of image
-								channels = self._getimage().split()
-								# Create white CMYK image in the same size as 
-								# our real image
-								img = Image.new("CMYK",
-												(self._getimage().size[0],
-												 self._getimage().size[1]),
-												(0, 0, 0, 0))
-								# Get first channel of created image
-								zero = img.split()[0].tostring()
-								# Compare channels to see if C, M, Y are empty
-								if (zero == channels[0].tostring() ==
-									channels[1].tostring() ==
-									channels[2].tostring()):
-									# Monochrome image
-									self._iscmykgrayimage = True
-									self.msg("CMYK image is really a grayscale "
-											 "image (CMY channels are empty).")
-									if ((not self.convertgrayimages or
-										 not (self.ICCProfiles["out_gray"].fileName or
-										 self.ICCProfiles["out"].fileName)) and
-										self.cmykgrayimages_stripcmy):
-										self.msg("Stripping CMY...")
-										try:
-											self._setimage(ImageChops.invert(Image.merge("L", [channels[3]])))
-										except Exception, v:
-											self.errorcount += 1
-											self.msg("ERROR - fatal error while"
-													 "processing image: " + traceback.format_exc())
-											self.msg("Try re-saving the image"
-													 "from your imaging "
-													 "application.")
-											self._abort()
-										return ""
+			if "cmykgray" in self._imageinfo:
+				self._iscmykgrayimage = bool(self._imageinfo["cmykgray"])
+			else:
+				self.msg("Checking if CMYK image is really a grayscale image...")
+				self._iscmykgrayimage = self._iscmykgray()
+				if not self._reduced:
+					self._setimageinfo(cmykgray=self._iscmykgrayimage)
+			if self._iscmykgrayimage:
+				# Monochrome image
+				self.msg("CMYK image is really a grayscale "
+						 "image (CMY channels are empty).")
+				if ((not self.convertgrayimages or
+					 not (self.ICCProfiles["out_gray"].fileName or
+					 self.ICCProfiles["out"].fileName)) and
+					self.cmykgrayimages_stripcmy):
+					self.msg("Stripping CMY...")
+					try:
+						self._setimage(ImageChops.invert(self._getimage().split()[3]))
+					except Exception, v:
+						self.errorcount += 1
+						self.msg("ERROR - fatal error while"
+								 "processing image: " + traceback.format_exc())
+						self.msg("Try re-saving the image"
+								 "from your imaging "
+								 "application.")
+						self._abort()
+					return ""
+	
+	def _iscmykgray(self):
+		""" Check if the C, M and Y channels of the image are empty """
+		# First test 5 pixels, if they are all equal, test the whole image
+		# 1   2
+		#   3
+		# 4   5
+		w, h = self._getimage().size
+		for x, y in ((w / 4, h / 4), ((w / 4) * 3, h / 4), (w / 2, h / 2),
+					 (w / 4, (h / 4) * 3), ((w / 4) * 3, (h / 4) * 3)):
+			test = self._getimage().getpixel((x, y))
+			if not test[0] == test[1] == test[2] == 0:
+				return False
+		# C, M, Y are empty if all their pixels are in the histogram's zero
+		# bins (histogram() is a single pass over the image which does not
+		# copy the channels, unlike split() or getextrema())
+		histogram = self._getimage().histogram()
+		return histogram[0] == histogram[256] == histogram[512] == w * h
+	
+	def _isrgbgray(self):
+		""" Check if the channels of the RGB image are identical """
+		# First we test 5 pixels, if they are all equal, we test the whole
+		# image
+		# 1   2
+		#   3
+		# 4   5
+		w, h = self._getimage().size
+		for x, y in ((w / 4, h / 4), ((w / 4) * 3, h / 4), (w / 2, h / 2),
+					 (w / 4, (h / 4) * 3), ((w / 4) * 3, (h / 4) * 3)):
+			test = self._getimage().getpixel((x, y))
+			if not test[0] == test[1] == test[2]:
+				return False
+		return channels_equal(self._getimage())
+	
+	def _getimageinfo(self):
+		""" Look up stored analysis results for the original image in the
+		image info cache, and store its header information """
+		self._imageinfo = {}
+		self._imageinfopath = None
+		if not self._imageinfocache:
+			return
+		try:
+			self._imageinfo = self._imageinfocache.get(self._imgASCIIpath)
+		except Exception, v:
+			self.msg("WARNING - could not read image info cache: " +
+					 safe_str(v))
+			return
+		self._imageinfopath = self._imgASCIIpath
+		if self._imageinfo and self.verbose:
+			self.msg("Image info from cache: " + str(self._imageinfo))
+		if not "mode" in self._imageinfo:
+			image = self._getimage()
+			dpi = image.info.get("dpi", (None, None))
+			self._setimageinfo(mode=image.mode, width=image.size[0],
+							   height=image.size[1], xdpi=dpi[0], ydpi=dpi[1])
+	
+	def _setimageinfo(self, **info):
+		if not self._imageinfopath:
+			return
+		imageinfo = dict(self._imageinfo)
+		imageinfo.update(info)
+		if imageinfo == self._imageinfo:
+			return
+		try:
+			self._imageinfocache.set(self._imageinfopath, imageinfo)
+		except Exception, v:
+			self.msg("WARNING - could not write image info cache: " +
+					 safe_str(v))
+		else:
+			self._imageinfo = imageinfo
 
 	def profiles_same(self, *profiles):
 		sameprofiles = {}
@@ -1206,30 +1612,52 @@ class OPIparser:
 					add(index, profiles[0], profile)
 		return sameprofiles
 	
+	def _getembeddedprofile(self, data):
+		# Embedded profiles are kept in memory instead of being written to the
+		# temp directory. They are looked up by a checksum of the raw data so
+		# the profile ID only needs to be calculated once per profile.
+		key = md5(data).digest()
+		if not key in self._embeddedprofiles:
+			profile = ICCProfile(data)
+			profile.calculateID()
+			if not profile.ID in self._cmsprofiles:
+				self._cmsprofiles[profile.ID] = ImageCms.ImageCmsProfile(StringIO(data))
+			self._embeddedprofiles[key] = profile
+		return self._embeddedprofiles[key]
+	
+	def _getcmsprofile(self, profile):
+		# Profiles from files are keyed by filename, embedded profiles by ID
+		key = profile.fileName or profile.ID
+		if not key in self._cmsprofiles:
+			self._cmsprofiles[key] = ImageCms.ImageCmsProfile(profile.fileName)
+		return self._cmsprofiles[key]
+	
+	def _needscolorconversion(self, mode=None):
+		if mode is None:
+			mode = self._getimage().mode
+		return ((self.ICCProfiles["out"].fileName and
+				 (mode == "RGB" or
+				  (mode == "CMYK" and self.convertcmykimages and
+				   not (self._iscmykgrayimage and
+						self.ICCProfiles["out_gray"].fileName)))) or
+				((self.ICCProfiles["out_gray"].fileName or
+				  self.convertgrayimages) and 
+				 (mode == "L" or self._iscmykgrayimage)) or
+				(self.ICCProfiles["out_RGB_gray"].fileName and
+				 mode == "RGB"))
+	
 	def _ICCtransform(self):
 		srcprofile = None
 		proofintent = 0
 		proofprofile = None
 		intent = 0
 		profile = None
-		if ((self.ICCProfiles["out"].fileName and
-			 (self._getimage().mode == "RGB" or
-			  (self._getimage().mode == "CMYK" and self.convertcmykimages and
-			   not (self._iscmykgrayimage and
-					self.ICCProfiles["out_gray"].fileName)))) or
-			((self.ICCProfiles["out_gray"].fileName or
-			  self.convertgrayimages) and 
-			 (self._getimage().mode == "L" or self._iscmykgrayimage)) or
-			(self.ICCProfiles["out_RGB_gray"].fileName and
-			 self._getimage().mode == "RGB")):
+		if self._needscolorconversion():
 			self.msg("Getting source profile...")
 			if (self._getimage().info.has_key("icc_profile") and
 				len(self._getimage().info["icc_profile"]) > 0):
-				srcprofile = ICCProfile(self._getimage().info["icc_profile"])
-				srcprofile.calculateID()
-				srcprofile.fileName = path.join(gettempdir(),
-												binascii.hexlify(srcprofile.ID)
-												+ '.icc')
+				srcprofile = self._getembeddedprofile(self._getimage().info["icc_profile"])
+				self._setimageinfo(profile_id=binascii.hexlify(srcprofile.ID))
 			else:
 				self.msg("...none found, falling back to working spaces (if "
 						 "defined)")
@@ -1240,7 +1668,8 @@ class OPIparser:
 				elif self._getimage().mode == "RGB":
 					srcprofile = self.ICCProfiles["working_RGB"]
 
-			if not srcprofile.fileName:
+			if (not srcprofile.fileName and
+				not srcprofile.ID in self._cmsprofiles):
 				self.msg("...no source profile, skipping color conversion")
 			else:
 				self.msg("Source profile: " + srcprofile.getDescription())
@@ -1254,49 +1683,32 @@ class OPIparser:
 					if (self._getimage().mode == "RGB" and
 						(self.ICCProfiles["proof_RGB_gray"].fileName or
 						 self.ICCProfiles["out_RGB_gray"].fileName)):
-						self.msg("Checking if image is R=G=B...")
 						# Allow converting of "R=G=B" images to grayscale or
 						# special "monochrome" profile (which could be grayscale
 						# or max GCR CMYK for example)
-						# First we test 5 pixels, if they are all equal, we test
-						# the whole image
-						# 1   2
-						#   3
-						# 4   5
-						w, h = self._getimage().size
-						test1 = self._getimage().getpixel((w / 4, h / 4))
-						if test1[0] == test1[1] == test1[2]:
-							test2 = self._getimage().getpixel(((w / 4) * 3,
-															   (h / 4)))
-							if test2[0] == test2[1] == test2[2]:
-								test3 = self._getimage().getpixel((w / 2,
-																   h / 2))
-								if test3[0] == test3[1] == test3[2]:
-									test4 = self._getimage().getpixel(((w / 4),
-																	   (h / 4) * 3))
-									if test4[0] == test4[1] == test4[2]:
-										test5 = self._getimage().getpixel(((w / 4) * 3,
-																		   (h / 4) * 3))
-										if test5[0] == test5[1] == test5[2]:
-											red, green, blue = [channel.tostring()
-																for channel in
-																self._getimage().split()]
-											if red == green == blue:
-												# it's a monochrome image
-												self.msg("RGB image is an "
-														 "'R=G=B' image "
-														 "(identical channels)")
-												if self.ICCProfiles["proof_RGB_gray"].fileName:
-													self.msg("...using 'RGB gray' proofing profile")
-													proofprofile = self.ICCProfiles["proof_RGB_gray"]
-												if self.ICCProfiles["out_RGB_gray"].fileName:
-													self.msg("...using 'RGB gray' destination profile")
-													profile = self.ICCProfiles["out_RGB_gray"]
-												if profile.colorSpace == "GRAY":
-													self._ImageColorType = "Process"
-													self._ImageColor = [0, 0, 0, 1, "Black"]
-													self._ImageTint = 1.0
-													self._ImageInks = "monochrome 1 (Black) 1.0"
+						rgbgray = self._imageinfo.get("rgbgray")
+						if rgbgray is None or (not rgbgray and self._sizemod):
+							# A stored result for the whole image is also valid
+							# for any crop if positive, but not if negative
+							self.msg("Checking if image is R=G=B...")
+							rgbgray = self._isrgbgray()
+							if not self._sizemod:
+								self._setimageinfo(rgbgray=rgbgray)
+						if rgbgray:
+							# it's a monochrome image
+							self.msg("RGB image is an 'R=G=B' image "
+									 "(identical channels)")
+							if self.ICCProfiles["proof_RGB_gray"].fileName:
+								self.msg("...using 'RGB gray' proofing profile")
+								proofprofile = self.ICCProfiles["proof_RGB_gray"]
+							if self.ICCProfiles["out_RGB_gray"].fileName:
+								self.msg("...using 'RGB gray' destination profile")
+								profile = self.ICCProfiles["out_RGB_gray"]
+							if profile.colorSpace == "GRAY":
+								self._ImageColorType = "Process"
+								self._ImageColor = [0, 0, 0, 1, "Black"]
+								self._ImageTint = 1.0
+								self._ImageInks = "monochrome 1 (Black) 1.0"
 				else:
 					if self.ICCProfiles["proof_gray"].fileName:
 						self.msg("...using gray proofing profile")
@@ -1338,103 +1750,214 @@ class OPIparser:
 					 (proofprofile.fileName and 
 					  not self.profiles_same(srcprofile, proofprofile)))):
 					
-					flags = self._ImageCms_flags
-					
-					# Output transform
-					if self.intent[0] == "a":
-						intent = 3
-					if self.intent[0] == "b":
-						intent = 1
-						flags.append(ImageCms.FLAGS["BLACKPOINTCOMPENSATION"])
-					elif self.intent[0] == "r":
-						intent = 1
-					elif self.intent[0] == "s":
-						intent = 2
-					else:
-						intent = 0
-					
 					# Proofing transform
-					if ((self.ICCProfiles["proof"].fileName and 
-						 (self._getimage().mode == "RGB" or
-						  (self._getimage().mode == "CMYK" and
-						   self.convertcmykimages and
-						   not self._iscmykgrayimage))) or
-						(self.ICCProfiles["proof_gray"].fileName and
-						 (self._getimage().mode == "L" or
-						  self._iscmykgrayimage)) or 
-						(self.ICCProfiles["proof_RGB_gray"].fileName and
-						 self._getimage().mode == "RGB")):
-						
-						flags.append(ImageCms.FLAGS["SOFTPROOFING"])
-						
-						if self.proofintent[0] == "a":
-							proofintent = 3
-						if self.proofintent[0] == "b":
-							proofintent = 1
-							flags.append(ImageCms.FLAGS["BLACKPOINTCOMPENSATION"])
-						elif self.proofintent[0] == "r":
-							proofintent = 1
-						elif self.proofintent[0] == "s":
-							proofintent = 2
-						else:
-							proofintent = 0
-					
-					flag_bitmask = 0
-					for flag_bit in flags:
-						flag_bitmask |= flag_bit
+					proof = ((self.ICCProfiles["proof"].fileName and 
+							  (self._getimage().mode == "RGB" or
+							   (self._getimage().mode == "CMYK" and
+								self.convertcmykimages and
+								not self._iscmykgrayimage))) or
+							 (self.ICCProfiles["proof_gray"].fileName and
+							  (self._getimage().mode == "L" or
+							   self._iscmykgrayimage)) or 
+							 (self.ICCProfiles["proof_RGB_gray"].fileName and
+							  self._getimage().mode == "RGB"))
+					intent, proofintent, flag_bitmask = self._gettransformflags(proof)
 					
-					t_hash = md5(str(srcprofile.fileName) + chr(0) + str(intent)
-								 + chr(0) + str(profile.fileName) + chr(0) +
-								 str(proofintent) + chr(0) +
-								 str(proofprofile.fileName)).hexdigest()
-					if not self._transforms.has_key(t_hash):
-						if not path.exists(srcprofile.fileName):
-							f = open(srcprofile.fileName, "wb")
-							f.write(srcprofile.data)
-							f.close()
-						if proofprofile.fileName:
-							if self.profiles_same(profile, proofprofile):
-								proofprofile = None
-						if profile.colorSpace == "GRAY":
-							dstmode = "L"
-						elif profile.colorSpace in ("RGB", "CMYK"):
-							dstmode = profile.colorSpace
-						else:
-							self.msg("Unsupported profile color space '%s' - "
-									 "aborting..." % profile.colorSpace)
-							self._abort()
-							return
-						srcprofile_obj = ImageCms.ImageCmsProfile(srcprofile.fileName)
-						dstprofile_obj = ImageCms.ImageCmsProfile(profile.fileName)
-						if proofprofile and proofprofile.fileName:
-							proofprofile_obj = ImageCms.ImageCmsProfile(proofprofile.fileName)
-							transform = ImageCms.ImageCmsTransform(srcprofile_obj,
-																   dstprofile_obj,
-																   self._getimage().mode,
-																   dstmode,
-																   intent,
-																   proofprofile_obj,
-																   proofintent,
-																   flag_bitmask)
-						else:
-							transform = ImageCms.ImageCmsTransform(srcprofile_obj,
-																   dstprofile_obj,
-																   self._getimage().mode,
-																   dstmode,
-																   intent,
-																   None,
-																   0,
-																   flag_bitmask)
-						self._transforms[t_hash] = transform
+					if proofprofile.fileName:
+						if self.profiles_same(profile, proofprofile):
+							proofprofile = None
+					if profile.colorSpace == "GRAY":
+						dstmode = "L"
+					elif profile.colorSpace in ("RGB", "CMYK"):
+						dstmode = profile.colorSpace
 					else:
-						transform = self._transforms[t_hash]
+						self.msg("Unsupported profile color space '%s' - "
+								 "aborting..." % profile.colorSpace)
+						self._abort()
+						return
+					transform = self._gettransform(srcprofile, profile,
+												   proofprofile,
+												   self._getimage().mode,
+												   dstmode, intent,
+												   proofintent, flag_bitmask)
 					self.msg("Color converting image...")
 					info = self._getimage().info.copy()
-					self._setimage(transform.apply(self._getimage()))
+					self._setimage(cmsapply_tiled(transform, self._getimage(),
+												  self.workers))
 					info["icc_profile"] = profile.data
 					self._getimage().info = info
 				
 	
+	def _getintent(self, intent, flags):
+		""" Map an intent option (a, b, p, r or s) to an lcms intent """
+		if intent[0] == "a":
+			return 3
+		elif intent[0] == "b":
+			flags.append(ImageCms.FLAGS["BLACKPOINTCOMPENSATION"])
+			return 1
+		elif intent[0] == "r":
+			return 1
+		elif intent[0] == "s":
+			return 2
+		return 0
+	
+	def _getprofilekey(self, profile):
+		# Profiles from files are keyed by filename, embedded profiles by ID
+		return profile.fileName or profile.ID
+	
+	def _gettransformflags(self, proof = False):
+		""" Return output intent, proofing intent and flag bitmask """
+		# Copy the flags so the global flags do not accumulate
+		flags = list(self._ImageCms_flags)
+		
+		# Output transform
+		intent = self._getintent(self.intent, flags)
+		
+		# Proofing transform
+		proofintent = 0
+		if proof:
+			flags.append(ImageCms.FLAGS["SOFTPROOFING"])
+			proofintent = self._getintent(self.proofintent, flags)
+		
+		flag_bitmask = 0
+		for flag_bit in flags:
+			flag_bitmask |= flag_bit
+		return intent, proofintent, flag_bitmask
+	
+	def _gettransform(self, srcprofile, dstprofile, proofprofile, inmode,
+					  outmode, intent, proofintent, flags):
+		""" Get a transform from the transform cache, creating it if needed """
+		if not (proofprofile and proofprofile.fileName):
+			proofprofile = None
+			proofintent = 0
+		key = (self._getprofilekey(srcprofile),
+			   self._getprofilekey(dstprofile),
+			   proofprofile and self._getprofilekey(proofprofile),
+			   inmode, outmode, intent, proofintent, flags)
+		# Hold the lock while building so an image waits for a transform
+		# that is currently being built by the warm-up thread instead of
+		# building it a second time
+		self._transformlock.acquire()
+		try:
+			transform = self._transforms.get(key)
+			if transform:
+				if self.verbose:
+					self.msg("Using cached transform")
+			else:
+				if proofprofile:
+					proofprofile_obj = self._getcmsprofile(proofprofile)
+				else:
+					proofprofile_obj = None
+				transform = ImageCms.ImageCmsTransform(self._getcmsprofile(srcprofile),
+													   self._getcmsprofile(dstprofile),
+													   inmode,
+													   outmode,
+													   intent,
+													   proofprofile_obj,
+													   proofintent,
+													   flags)
+				evicted = self._transforms.set(key, transform)
+				if evicted and self.verbose:
+					self.msg("Transform cache full, evicted %i transform(s)" %
+							 evicted)
+				if (srcprofile.fileName and dstprofile.fileName and
+					not key in self._transformrecipes):
+					# Only transforms between profile files can be rebuilt by
+					# a later job
+					self._transformrecipes.append(key)
+		finally:
+			self._transformlock.release()
+		return transform
+	
+	def _warmup(self):
+		""" Prebuild the working space to output (and proofing) transforms
+		for RGB, CMYK and grayscale images. Runs in its own thread. """
+		tstart = time()
+		if self._tracelog:
+			self._tracelog.threadname("warm-up")
+			self._tracelog.begin("warm-up", "transform")
+		try:
+			if self.transformlist:
+				self._prebuildtransforms()
+			for mode in ("RGB", "CMYK", "L"):
+				if self._terminated:
+					break
+				if mode == "L":
+					if not (self.ICCProfiles["out_gray"].fileName or
+							self.convertgrayimages):
+						continue
+					srcprofile = self.ICCProfiles["working_gray"]
+					profile = self.ICCProfiles["out_gray"]
+					if not profile.fileName:
+						profile = self.ICCProfiles["out"]
+					proofprofile = self.ICCProfiles["proof_gray"]
+					proof = bool(proofprofile.fileName)
+					if not proof:
+						proofprofile = self.ICCProfiles["proof"]
+				else:
+					if mode == "CMYK" and not self.convertcmykimages:
+						continue
+					srcprofile = self.ICCProfiles["working_" + mode]
+					profile = self.ICCProfiles["out"]
+					proofprofile = self.ICCProfiles["proof"]
+					proof = bool(proofprofile.fileName)
+				if (not srcprofile.fileName or not profile.fileName or
+					srcprofile.fileName == profile.fileName):
+					continue
+				if profile.colorSpace == "GRAY":
+					dstmode = "L"
+				elif profile.colorSpace in ("RGB", "CMYK"):
+					dstmode = profile.colorSpace
+				else:
+					continue
+				if proofprofile.fileName == profile.fileName:
+					proofprofile = None
+				intent, proofintent, flag_bitmask = self._gettransformflags(proof)
+				self._gettransform(srcprofile, profile, proofprofile, mode,
+								   dstmode, intent, proofintent, flag_bitmask)
+			if self.verbose:
+				self.msg("Warm-up finished in %.2f seconds" % (time() - tstart))
+		except Exception, v:
+			self.msg("WARNING - warm-up failed: " + traceback.format_exc())
+		if self._tracelog:
+			self._tracelog.end("warm-up", "transform")
+	
+	def _prebuildtransforms(self):
+		""" Build the transforms listed in the transform list file. Only
+		which transforms a job used is stored, so they are built again
+		from the profiles. """
+		if not path.isfile(self.transformlist):
+			return
+		self.msg("Prebuilding transforms listed in " + self.transformlist)
+		profiles = {}
+		recipes = open(self.transformlist, "rb")
+		for line in recipes:
+			recipe = line.rstrip("\r\n").split("\t")
+			if len(recipe) != 8:
+				continue
+			try:
+				for filename in recipe[0:3]:
+					if filename and not filename in profiles:
+						profiles[filename] = ICCProfile(filename, load=False)
+				self._gettransform(profiles[recipe[0]],
+								   profiles[recipe[1]],
+								   profiles.get(recipe[2]),
+								   recipe[3], recipe[4], int(recipe[5]),
+								   int(recipe[6]), int(recipe[7]))
+			except Exception, v:
+				self.msg("WARNING - could not load transform: " +
+						 safe_unicode(v))
+		recipes.close()
+	
+	def _savetransformlist(self):
+		""" Record the transforms between profile files in the transform list
+		file so the next job can prebuild them """
+		recipes = open(self.transformlist, "wb")
+		for key in self._transformrecipes:
+			recipes.write("\t".join([safe_str(item or "") for item in key]) +
+						  "\n")
+		recipes.close()
+	
 	def _getICCconf(self):
 		conf = ""
 		intents = {"a": "Absolute",
@@ -1493,8 +2016,13 @@ class OPIparser:
 		conf += ",ColorImageResolution:" + str(self.ColorImageResolution)
 		conf += ",ColorImageDownsampleThreshold:" + str(self.ColorImageDownsampleThreshold)
 		if sizemod:
-			if self._ImageCropFixed:
-				conf += ",ImageCropFixed:" + str(self._ImageCropFixed)
+			if self._unreduced:
+				# Same key as when processing the full size image
+				ImageCropFixed = self._unreduced[4]
+			else:
+				ImageCropFixed = self._ImageCropFixed
+			if ImageCropFixed:
+				conf += ",ImageCropFixed:" + str(ImageCropFixed)
 			if self._RealDimensions:
 				conf += ",RealDimensions:" + str(self._RealDimensions)
 		if colormod:
@@ -1506,6 +2034,10 @@ class OPIparser:
 		return conf
 	
 	def _SetDownsampleDimensions(self):
+		# An image reduced by _draft or _pyramid has already passed the
+		# downsample threshold at full size. Always finish with the exact
+		# resample, as the remaining factor is usually below the threshold.
+		reduced = bool(self._reduced)
 		if self._RealDimensions:
 			if self._getimage().mode != "1":
 				if (max(self._RealDimensions[0], self._RealDimensions[1]) <=
@@ -1533,10 +2065,10 @@ class OPIparser:
 						self.msg("_SetDownsampleDimensions: Using "
 								 "MonoImageResolution " +
 								 str(self._DownsampleRes))
-				if (self._RealRes[0] >
+				if (reduced or self._RealRes[0] >
 					self._DownsampleRes[0] * self.MonoImageDownsampleThreshold):
 					self._DownsampleDimensions[0] = (self._RealDimensions[0] / 72.0) * self._DownsampleRes[0]
-				if (self._RealRes[1] >
+				if (reduced or self._RealRes[1] >
 					self._DownsampleRes[1] * self.MonoImageDownsampleThreshold):
 					self._DownsampleDimensions[1] = (self._RealDimensions[1] / 72.0) * self._DownsampleRes[1]
 			elif self._getimage().mode == "L" and self.DownsampleGrayImages:
@@ -1556,11 +2088,11 @@ class OPIparser:
 						self.msg("_SetDownsampleDimensions: Using "
 								 "GrayImageResolution " +
 								 str(self._DownsampleRes))
-				if (self._RealRes[0] >
+				if (reduced or self._RealRes[0] >
 					self._DownsampleRes[0] * self.GrayImageDownsampleThreshold *
 					imagesizefactor):
 					self._DownsampleDimensions[0] = (self._RealDimensions[0] / 72.0) * self._DownsampleRes[0] * imagesizefactor
-				if (self._RealRes[1] > self._DownsampleRes[1] *
+				if (reduced or self._RealRes[1] > self._DownsampleRes[1] *
 					self.GrayImageDownsampleThreshold * imagesizefactor):
 					self._DownsampleDimensions[1] = (self._RealDimensions[1] / 72.0) * self._DownsampleRes[1] * imagesizefactor
 			elif (self._getimage().mode in ("RGB", "CMYK") and
@@ -1581,10 +2113,10 @@ class OPIparser:
 						self.msg("_SetDownsampleDimensions: Using "
 								 "ColorImageResolution " + 
 								 str(self._DownsampleRes))
-				if (self._RealRes[0] > self._DownsampleRes[0] *
+				if (reduced or self._RealRes[0] > self._DownsampleRes[0] *
 					self.ColorImageDownsampleThreshold * imagesizefactor):
 					self._DownsampleDimensions[0] = (self._RealDimensions[0] / 72.0) * self._DownsampleRes[0] * imagesizefactor
-				if (self._RealRes[1] > self._DownsampleRes[1] *
+				if (reduced or self._RealRes[1] > self._DownsampleRes[1] *
 					self.ColorImageDownsampleThreshold * imagesizefactor):
 					self._DownsampleDimensions[1] = (self._RealDimensions[1] / 72.0) * self._DownsampleRes[1] * imagesizefactor
 			if self._ImageCropFixed:
@@ -1606,10 +2138,292 @@ class OPIparser:
 											  int(round(self._getimage().size[1] *
 														self._DownsampleFactor[1]))]
 	
+	def _draft(self):
+		""" Let the JPEG decoder scale the image by 1/2, 1/4 or 1/8 if it is
+		going to be downsampled at least that much anyway. Downsampling
+		then always does the remaining exact resample from the smaller
+		image (see _SetDownsampleDimensions). The processed image is cached
+		under the original crop, so other placements find it (see
+		_SetReducedImage). """
+		image = self._getimage()
+		if (self._imageformat != "jpeg" or not image.tile or
+			not hasattr(image, "draft") or
+			# The image pyramid needs the full size image
+			self.pyramidcache in ("memory", "disk") or
+			# Stripping CMY changes the mode and thus the target resolution
+			(image.mode == "CMYK" and self.cmykgrayimages_stripcmy)):
+			return
+		factor = self._GetDownsampleFactor()
+		# Allow for rounding errors in the factor (see _pyramid)
+		if max(factor) > .5 + 1e-6:
+			return
+		size = image.size
+		# The decoder picks the largest scale which still gives at least the
+		# requested size. Allow for rounding errors in the factor, which
+		# could otherwise cost a whole scale step.
+		image.draft(image.mode, (int(math.ceil(size[0] * factor[0] - .001)),
+								 int(math.ceil(size[1] * factor[1] - .001))))
+		if image.size == size:
+			return
+		self.msg("Decoding JPEG at reduced size: %sx%s -> %sx%s" %
+				 (size + image.size))
+		self._SetReducedImage(image, size, self._imgASCIIpath + "|draft",
+							  factor)
+	
+	def _makeplan(self):
+		""" Work out from the image header alone which processing the image
+		needs, before anything is decoded. If it is passed through unchanged
+		and stored uncompressed, the image data can be read straight from
+		the file (see _getimagedata). Size and mode are taken from the image
+		info cache if it has them. """
+		if "mode" in self._imageinfo:
+			mode = self._imageinfo["mode"]
+			imagesize = (self._imageinfo["width"], self._imageinfo["height"])
+		else:
+			mode = self._getimage().mode
+			imagesize = self._getimage().size
+		endsize = [self._RealCropRect[2] - self._RealCropRect[0],
+				   self._RealCropRect[3] - self._RealCropRect[1]]
+		downsampledims = self._GetDownsampleDimensions(endsize,
+													   self._GetDownsampleFactor())
+		plan = {"crop": (float(imagesize[0] * imagesize[1]) /
+						 float(endsize[0] * endsize[1]) >=
+						 self.imagecropthreshold),
+				"downsample": (downsampledims[0] < endsize[0] or
+							   downsampledims[1] < endsize[1]),
+				"detect": (self._needsgraydetection(mode) and
+						   self._imageinfo.get("cmykgray") is not False),
+				"convert": bool(self._needscolorconversion(mode))}
+		if plan["crop"]:
+			size = endsize
+		else:
+			size = imagesize
+		if plan["downsample"]:
+			size = downsampledims
+		if mode == "1":
+			plan["bytes"] = (size[0] + 7) / 8 * size[1]
+		else:
+			plan["bytes"] = size[0] * size[1] * len(mode)
+		if self.mode.lower()[0] != "b":
+			plan["bytes"] *= 2
+		plan["passthrough"] = not (plan["crop"] or plan["downsample"] or
+								   plan["detect"] or plan["convert"])
+		if plan["passthrough"]:
+			plan["rawtiles"] = self._getrawtiles(self._getimage())
+		else:
+			plan["rawtiles"] = None
+		if self.verbose:
+			self.msg("Plan: " + ", ".join("%s=%s" % (key, plan[key]) for key in
+										  ("crop", "downsample", "detect",
+										   "convert", "passthrough",
+										   "bytes")) +
+					 (plan["rawtiles"] and ", reading raw data from file" or
+					  ""))
+		self._imageplan = plan
+	
+	def _getrawtiles(self, image):
+		""" Return the decoder tiles of an image which is not loaded yet if
+		they hold uncompressed rows in the image's own mode and byte order,
+		top to bottom (e.g. uncompressed TIFF strips) """
+		tile = getattr(image, "tile", None)
+		if not tile or image.mode not in ("L", "RGB", "CMYK"):
+			return None
+		y = 0
+		for decoder, box, offset, args in tile:
+			if (decoder != "raw" or tuple(box[0::2]) != (0, image.size[0]) or
+				box[1] != y or not isinstance(args, tuple) or
+				tuple(args[:3]) != (image.mode, 0, 1)):
+				return None
+			y = box[3]
+		if y != image.size[1]:
+			return None
+		return list(tile)
+	
+	def _getimagedata(self):
+		""" Get the (binary) image data. Images passed through unchanged are
+		read straight from the file if possible, without decoding. """
+		image = self._getimage()
+		if (self._imageplan and self._imageplan["rawtiles"] and
+			getattr(image, "tile", None) == self._imageplan["rawtiles"] and
+			getattr(image, "filename", None)):
+			data = []
+			fp = open(image.filename, "rb")
+			try:
+				for decoder, box, offset, args in self._imageplan["rawtiles"]:
+					fp.seek(offset)
+					data.append(fp.read((box[2] - box[0]) * (box[3] - box[1]) *
+										len(image.mode)))
+			finally:
+				fp.close()
+			data = "".join(data)
+			if len(data) == image.size[0] * image.size[1] * len(image.mode):
+				if self.verbose:
+					self.msg("Read raw image data from file")
+				return data
+		if hasattr(image, "tobytes"):
+			# Pillow >= 2.0 (tostring raises NotImplementedError in Pillow >= 3)
+			return image.tobytes()
+		return image.tostring()
+	
+	def _pyramid(self):
+		""" Start downsampling from the smallest power-of-two reduction of the
+		image which still has at least the target resolution. The reduction
+		is always resampled to the exact target size afterwards (see
+		_SetDownsampleDimensions). Reductions are kept in the memory cache,
+		and with pyramidcache=disk also in a "pyramid" directory next to the
+		image, so other placements of the same image do not resample from
+		full resolution again. """
+		image = self._getimage()
+		if (self.pyramidcache not in ("memory", "disk") or self._reduced or
+			image.mode not in ("L", "RGB", "CMYK")):
+			return
+		factor = self._GetDownsampleFactor()
+		level = 0
+		# Allow for rounding errors in the factor, so an exact power-of-two
+		# reduction does not end up one level short
+		while (max(factor) * 2 ** (level + 1) <= 1 + 1e-6 and
+			   min(image.size) >> (level + 1)):
+			level += 1
+		if not level:
+			return
+		# Find the deepest reduction already built
+		n = level
+		reduced = None
+		while n and reduced is None:
+			reduced = self._getpyramidlevel(image, n)
+			if reduced is None:
+				n -= 1
+		if reduced is None:
+			reduced = image
+		if n < level:
+			self.msg("Building image pyramid...")
+			try:
+				while n < level:
+					n += 1
+					reduced = resize_parallel(reduced,
+											  ((reduced.size[0] + 1) // 2,
+											   (reduced.size[1] + 1) // 2),
+											  Image.ANTIALIAS, self.workers)
+					reduced.info = image.info.copy()
+					self._setpyramidlevel(image, n, reduced)
+			except Exception, v:
+				self.msg("WARNING - could not build image pyramid: " +
+						 traceback.format_exc())
+				return
+		self.msg("Using image pyramid level %i: %sx%s -> %sx%s" %
+				 ((level, ) + image.size + reduced.size))
+		self._SetReducedImage(reduced, image.size,
+							  self._getpyramidkey(image, level), factor)
+	
+	def _getpyramidkey(self, image, level):
+		return "%s|pyramid|%s|%i" % (self._imgASCIIpath, image.mode, level)
+	
+	def _getpyramidpath(self, image, level):
+		return "%s.%s.%i.tif" % (self._gettmppath("pyramid"), image.mode,
+								 level)
+	
+	def _getpyramidlevel(self, image, level):
+		key = md5(self._getpyramidkey(image, level)).hexdigest()
+		if self._imagecache.has_key(key):
+			self._cacheevent("pyramid hit", source="memory", level=level)
+			return self._imagecache[key]["image"]
+		if self.pyramidcache == "disk":
+			levelpath = self._getpyramidpath(image, level)
+			if self._is_disk_cached(levelpath) and self._is_same_age(levelpath):
+				try:
+					reduced = Image.open(levelpath)
+				except Exception, v:
+					self.msg("WARNING - could not open image pyramid level: " +
+							 safe_str(v))
+				else:
+					reduced.info = image.info.copy()
+					self._cacheevent("pyramid hit", source="disk", level=level)
+					self._setpyramidlevel(image, level, reduced, False)
+					return reduced
+	
+	def _setpyramidlevel(self, image, level, reduced, save = True):
+		imgpath_md5 = self._imgpath_md5
+		self._set_imgpath_md5(self._getpyramidkey(image, level))
+		self._setimage(reduced)
+		self._imgpath_md5 = imgpath_md5
+		if self.pyramidcache == "disk" and save:
+			levelpath = self._getpyramidpath(image, level)
+			try:
+				if not path.exists(path.dirname(levelpath)):
+					mkdir(path.dirname(levelpath))
+				reduced.save(levelpath, "TIFF")
+				# Same age as the original, so changes to it are detected
+				st = os.stat(self._imgASCIIpath)
+				os.utime(levelpath, (st.st_atime, st.st_mtime))
+			except Exception, v:
+				self.msg("WARNING - could not write image pyramid level: " +
+						 safe_str(v))
+	
+	def _GetDownsampleFactor(self):
+		""" Get the downsample factor without changing any state. """
+		state = (self._DownsampleDimensions, self._DownsampleFactor,
+				 self._DownsampleRes)
+		self._DownsampleDimensions = [self._getimage().size[0],
+									  self._getimage().size[1]]
+		self._SetDownsampleDimensions()
+		factor = self._DownsampleFactor
+		(self._DownsampleDimensions, self._DownsampleFactor,
+		 self._DownsampleRes) = state
+		return factor
+	
+	def _SetReducedImage(self, image, size, key, factor):
+		""" Replace the image (original size size, downsample factor factor)
+		with a reduced version of it, scaling the crop rectangle and
+		resolution accordingly. """
+		scale = (float(image.size[0]) / size[0],
+				 float(image.size[1]) / size[1])
+		# Downsampling still works out the final size and source box from
+		# the original, so they do not depend on the rounding of the reduced
+		# crop rectangle (see _GetUnreducedDownsampleDimensions). The
+		# original crop also keys the processed image in the cache (see
+		# _getimageconf), so it is found again for other placements.
+		self._unreduced = (size, self._RealCropRect, factor, scale,
+						   self._ImageCropFixed)
+		if self._ImageCropFixed:
+			# Scale the crop, keeping any adjustments made to the real crop
+			# rectangle
+			_ImageCropFixed = []
+			_RealCropRect = []
+			for i, v in enumerate(self._ImageCropFixed):
+				if i > 1 and 2.0 in self._version:
+					# Assume QuarkXPress
+					rnd = math.ceil
+				else:
+					rnd = math.floor
+				_ImageCropFixed.append(v * scale[i % 2])
+				adjust = self._RealCropRect[i] - int(rnd(v))
+				_RealCropRect.append(min(max(int(rnd(_ImageCropFixed[i])) +
+											 adjust, 0), image.size[i % 2]))
+			self._ImageCropFixed = _ImageCropFixed
+			self._ImageCropRect = intlist(_ImageCropFixed)
+			self._RealCropRect = _RealCropRect
+		else:
+			self._RealCropRect = [0, 0, image.size[0], image.size[1]]
+		if self._RealRes:
+			self._RealRes = [self._RealRes[0] * scale[0],
+							 self._RealRes[1] * scale[1]]
+		self._DownsampleDimensions = [image.size[0], image.size[1]]
+		# _ImageDimensions stays the size of the original, as written to the
+		# output comments when not reducing
+		self._IncludedImageDimensions = [image.size[0], image.size[1]]
+		# Keep the reduced image apart from a full size decode of the same
+		# file in the memory cache
+		self._delimage()
+		self._set_imgpath_md5(key)
+		self._setimage(image)
+		self._reduced = True
+	
 	def _CropAndDownsample(self):
 		cropped = False
 		imagecopy = False
-		self._sizemod  = False
+		# A reduced image (see _draft and _pyramid) is size modified even if
+		# it is not cropped or downsampled any further
+		self._sizemod  = bool(self._reduced)
 		endsize = [self._RealCropRect[2] - self._RealCropRect[0],
 				   self._RealCropRect[3] - self._RealCropRect[1]]
 		# crop() discards the info dict - copy from original
@@ -1618,12 +2432,22 @@ class OPIparser:
 		##if (self._getimage().info.has_key("icc_profile") and
 			##len(self._getimage().info["icc_profile"]) > 0):
 		##icc_profile = self._getimage().info["icc_profile"]
-		if (float(self._getimage().size[0] * self._getimage().size[1]) /
-			float(endsize[0] * endsize[1]) >= self.imagecropthreshold):
-			# Only crop if >= imagecropthreshold % are outside cropping region
+		# Only crop if >= imagecropthreshold % are outside cropping region
+		crop = (float(self._getimage().size[0] * self._getimage().size[1]) /
+				float(endsize[0] * endsize[1]) >= self.imagecropthreshold)
+		if crop and RESIZE_BOX and self._ImageCropFixed:
+			self._DownsampleDimensions = self._GetDownsampleDimensions(endsize)
+			if self._reduced:
+				self._DownsampleDimensions = self._GetUnreducedDownsampleDimensions(True)
+			if (self._DownsampleDimensions[0] < endsize[0] or
+				self._DownsampleDimensions[1] < endsize[1]):
+				return self._CropAndResample(info)
+		if crop:
+			self._stats.stage("crop")
 			self.msg("Cropping image...")
 			try:
 				_image = self._getimage()
+				partial = self._loadcropregion(_image)
 				if not imagecopy:
 					self._imgASCIIpath = (self._gettmppath() + "." +
 										  crc32(self._getimageconf(True,
@@ -1637,8 +2461,13 @@ class OPIparser:
 											self._RealCropRect[3]]))
 				# crop() is a lazy operation, call load() to prevent python crash
 				self._getimage().load()
+				if partial:
+					# The partially read image must not be reused for other
+					# placements of the same file
+					self._delimage(partial)
 				cropped = True
 				self._sizemod  = True
+				self._IncludedImageDimensions = intlist(self._getimage().size)
 				if self.verbose:
 					self.msg("Crop rectangle: " + str(self._RealCropRect))
 					self.msg("Cropped size: " + str(self._getimage().size[0]) +
@@ -1657,19 +2486,12 @@ class OPIparser:
 								  0,
 								  self._getimage().size[0],
 								  self._getimage().size[1]]
-		if 2.0 in self._version:
-			# Assume QuarkXPress
-			self._DownsampleDimensions = [int(math.ceil(endsize[0] *
-														self._DownsampleFactor[0])),
-										  int(math.ceil(endsize[1] *
-														self._DownsampleFactor[1]))]
-		else:
-			self._DownsampleDimensions = [int(round(endsize[0] *
-													self._DownsampleFactor[0])),
-										  int(round(endsize[1] *
-													self._DownsampleFactor[1]))]
+		self._DownsampleDimensions = self._GetDownsampleDimensions(endsize)
+		if self._reduced:
+			self._DownsampleDimensions = self._GetUnreducedDownsampleDimensions(crop)
 		if (self._DownsampleDimensions[0] < endsize[0] or
 			self._DownsampleDimensions[1] < endsize[1]):
+			self._stats.stage("downsample")
 			self.msg("Downsampling image: %s dpi -> %s dpi..." %
 					 ("x".join(str(dpi) for dpi in self._RealRes),
 					  "x".join(str(dpi) for dpi in self._DownsampleRes)))
@@ -1682,15 +2504,9 @@ class OPIparser:
 										  self._imageextension)
 					self._set_imgpath_md5(self._imgASCIIpath)
 					imagecopy = True
-				if _image.mode in ("RGB", "RGBA", "CMYK", "CMYKA"):
-					DownsampleFilter = self.ColorImageDownsampleFilter
-				elif _image.mode in ("L", "LA"):
-					DownsampleFilter = self.GrayImageDownsampleFilter
-				else:
-					DownsampleFilter = self.MonoImageDownsampleFilter
-				self._setimage(_image.resize((self._DownsampleDimensions[0],
-											  self._DownsampleDimensions[1]),
-											 DownsampleFilter))
+				self._setimage(self._Resize(_image,
+											(self._DownsampleDimensions[0],
+											 self._DownsampleDimensions[1])))
 				self._sizemod  = True
 				self._ImageCropFixed = [self._ImageCropFixed[0] *
 										self._DownsampleFactor[0],
@@ -1702,18 +2518,7 @@ class OPIparser:
 										self._DownsampleFactor[1]]
 				self._ImageCropRect = intlist(self._ImageCropFixed)
 				if cropped:
-					self._RealCropRect = []
-					self._RealCropRect.append(int(math.floor(self._ImageCropFixed[0])))
-					self._RealCropRect.append(int(math.floor(self._ImageCropFixed[1])))
-					if 2.0 in self._version:
-						# Assume QuarkXPress
-						self._RealCropRect.append(int(math.ceil(self._ImageCropFixed[2])))
-						self._RealCropRect.append(int(math.ceil(self._ImageCropFixed[3])))
-					else:
-						self._RealCropRect.append(int(math.floor(self._ImageCropFixed[2])))
-						self._RealCropRect.append(int(math.floor(self._ImageCropFixed[3])))
-						##self._RealCropRect.append(int(round(self._ImageCropFixed[2])))
-						##self._RealCropRect.append(int(round(self._ImageCropFixed[3])))
+					self._RealCropRect = self._GetRealCropRect(self._ImageCropFixed)
 				else:
 					self._RealCropRect = [0, 0, self._getimage().size[0], self._getimage().size[1]]
 				self._IncludedImageDimensions = intlist(self._getimage().size)
@@ -1732,8 +2537,144 @@ class OPIparser:
 		self._getimage().info = info
 		##if icc_profile != None:
 			##self._getimage().info["icc_profile"] = icc_profile
-		return self._sizemod 
-	
+		return self._sizemod
+
+	def _CropAndResample(self, info):
+		"""
+		Crop and downsample the image in a single resampling pass.
+
+		The source box is the crop rectangle, so the result is the same as
+		cropping and then downsampling, but no full resolution cropped copy
+		is made. Its time is recorded as downsampling.
+
+		"""
+		self._stats.stage("downsample")
+		self.msg("Cropping and downsampling image: %s dpi -> %s dpi..." %
+				 ("x".join(str(dpi) for dpi in self._RealRes),
+				  "x".join(str(dpi) for dpi in self._DownsampleRes)))
+		try:
+			_image = self._getimage()
+			partial = self._loadcropregion(_image)
+			self._imgASCIIpath = (self._gettmppath() + "." +
+								  crc32(self._getimageconf(True, False)) +
+								  self._imageextension)
+			self._set_imgpath_md5(self._imgASCIIpath)
+			if self._reduced:
+				# The original crop rectangle, not its rounded reduction
+				croprect, scale = self._unreduced[1], self._unreduced[3]
+				box = [croprect[0] * scale[0], croprect[1] * scale[1],
+					   croprect[2] * scale[0], croprect[3] * scale[1]]
+			else:
+				box = self._RealCropRect
+			box = [max(box[0], 0), max(box[1], 0),
+				   min(box[2], _image.size[0]), min(box[3], _image.size[1])]
+			factor = self._DownsampleFactor
+			self._ImageCropFixed = [self._ImageCropFixed[0] * factor[0],
+									self._ImageCropFixed[1] * factor[1],
+									self._ImageCropFixed[2] * factor[0],
+									self._ImageCropFixed[3] * factor[1]]
+			self._ImageCropRect = intlist(self._ImageCropFixed)
+			self._RealCropRect = self._GetRealCropRect(self._ImageCropFixed)
+			self._setimage(self._Resize(_image,
+										(self._DownsampleDimensions[0],
+										 self._DownsampleDimensions[1]), box))
+			if partial:
+				# The partially read image must not be reused for other
+				# placements of the same file
+				self._delimage(partial)
+			self._sizemod  = True
+			self._IncludedImageDimensions = intlist(self._getimage().size)
+			if self.verbose:
+				self.msg("Source box: " + str(box))
+				self.msg("Crop rectangle: " + str(self._RealCropRect))
+				self.msg("Downsampled size: " +
+						 str(self._getimage().size[0]) + "x" +
+						 str(self._getimage().size[1]))
+		except Exception, v:
+			self.errorcount += 1
+			self.msg("ERROR - fatal error while cropping and downsampling: " +
+					 traceback.format_exc())
+			self.msg("Try re-saving the image from your imaging "
+					 "application.")
+			self._abort()
+			return None
+		self._getimage().info = info
+		return self._sizemod
+
+	def _GetDownsampleDimensions(self, size, factor = None):
+		if factor is None:
+			factor = self._DownsampleFactor
+		if 2.0 in self._version:
+			# Assume QuarkXPress
+			return [int(math.ceil(size[0] * factor[0])),
+					int(math.ceil(size[1] * factor[1]))]
+		else:
+			return [int(round(size[0] * factor[0])),
+					int(round(size[1] * factor[1]))]
+
+	def _GetUnreducedDownsampleDimensions(self, crop):
+		""" The size downsampling the original of a reduced image (see
+		_SetReducedImage) to the crop rectangle, or without cropping, would
+		give. """
+		size, croprect, factor = self._unreduced[:3]
+		if crop:
+			size = [croprect[2] - croprect[0], croprect[3] - croprect[1]]
+		return self._GetDownsampleDimensions(size, factor)
+
+	def _Resize(self, image, size, box = None):
+		""" Downsample an image (or a source box of it) with the configured
+		filter. With fastdownsample, box-reduce by the largest integer factor
+		first (see lib.util_image.reduce_resize). """
+		if self.fastdownsample:
+			resize = reduce_resize
+		else:
+			resize = resize_parallel
+		return resize(image, size, self._GetDownsampleFilter(image.mode),
+					  self.workers, box)
+
+	def _GetDownsampleFilter(self, mode):
+		if mode in ("RGB", "RGBA", "CMYK", "CMYKA"):
+			return self.ColorImageDownsampleFilter
+		elif mode in ("L", "LA"):
+			return self.GrayImageDownsampleFilter
+		else:
+			return self.MonoImageDownsampleFilter
+
+	def _GetRealCropRect(self, ImageCropFixed):
+		RealCropRect = []
+		RealCropRect.append(int(math.floor(ImageCropFixed[0])))
+		RealCropRect.append(int(math.floor(ImageCropFixed[1])))
+		if 2.0 in self._version:
+			# Assume QuarkXPress
+			RealCropRect.append(int(math.ceil(ImageCropFixed[2])))
+			RealCropRect.append(int(math.ceil(ImageCropFixed[3])))
+		else:
+			RealCropRect.append(int(math.floor(ImageCropFixed[2])))
+			RealCropRect.append(int(math.floor(ImageCropFixed[3])))
+			##RealCropRect.append(int(round(ImageCropFixed[2])))
+			##RealCropRect.append(int(round(ImageCropFixed[3])))
+		return RealCropRect
+
+	def _loadcropregion(self, image):
+		"""
+		Only read the strips or tiles of a TIFF which intersect the crop
+		rectangle, plus a margin for the downsampling filter.
+
+		Returns the cache key of the partially read image, or None.
+
+		"""
+		if self._imageformat != "tiff":
+			return None
+		margin = int(math.ceil(3.0 * max(1.0, 1.0 /
+										 min(self._DownsampleFactor)))) + 1
+		if load_region(image, [self._RealCropRect[0] - margin,
+							   self._RealCropRect[1] - margin,
+							   self._RealCropRect[2] + margin,
+							   self._RealCropRect[3] + margin]):
+			self.msg("Read only the parts of the image inside the crop "
+					 "rectangle")
+			return self._imgpath_md5
+
 	def _SetRealDimensions(self): # set "real" dimensions in pt
 		if self._ImagePosition:
 			# Width in pt
@@ -1911,6 +2852,9 @@ class OPIparser:
 								   2)) + " MB. New cache size: " +
 						 str(round(self._cachebytes / 1024.0 / 1024.0, 2)) +
 						 " MB")
+				self._cacheevent("cache evict",
+								 path=safe_unicode(self._imagecache[img]["path"]),
+								 bytes=self._imagecache[img]["bytes"])
 				trash.append(img)
 		for img in trash:
 			del self._imagecache[img]
@@ -1930,7 +2874,8 @@ class OPIparser:
 				bpp = 8
 			bytes = (image.size[0] * image.size[1] * len(image.mode) * bpp) / 8
 		else:
-			bytes = len(image.data)
+			# EPS, streamed from the file when written
+			bytes = 0
 		self._checkpurgecache(bytes)
 		if self._imagecache.has_key(self._imgpath_md5):
 			self._cachebytes -= self._imagecache[self._imgpath_md5]["bytes"]
@@ -1951,9 +2896,14 @@ class OPIparser:
 			key = self._imgpath_md5
 		if self._imagecache.has_key(key):
 			self._cachebytes -= self._imagecache[key]["bytes"]
+			self._cacheevent("cache delete",
+							 path=safe_unicode(self._imagecache[key]["path"]),
+							 bytes=self._imagecache[key]["bytes"])
 			del self._imagecache[key]
 
 	def _write(self):
+		self._stats.stage("open")
+		outstart = self._out.tell()
 		self._SetRealDimensions()
 		
 		# Open the image
@@ -1996,6 +2946,8 @@ class OPIparser:
 				if self._is_mem_cached(tmppath) or self._is_same_age(tmppath):
 					# Recent version in cache
 					self._imagecached = True
+					self._cacheevent("cache hit", source="disk",
+									 path=safe_unicode(tmppath))
 					self.msg("Image already in cache")
 					self._imgASCIIpath = tmppath
 				else:
@@ -2014,6 +2966,9 @@ class OPIparser:
 					if self._aborted:
 						self._reset()
 						return
+					self._stats.set(cache=self._imagecached and "disk" or
+										  "file",
+									bytesin=stat(self._imgASCIIpath).st_size)
 					if self._imageformat != "epsf":
 						if self.verbose:
 							self.msg("Opening: " +self._imgASCIIpath)
@@ -2045,6 +3000,9 @@ class OPIparser:
 								   self._ImageFileName) + "\n" +
 								  safe_unicode(v))
 		else:
+			self._stats.set(cache="memory")
+			self._cacheevent("cache hit", source="memory",
+							 path=safe_unicode(self._imgASCIIpath))
 			self.msg("Image already in memory")
 		
 		if self._errorstr:
@@ -2224,11 +3182,18 @@ class OPIparser:
 						  minres[self._getimage().mode]):
 						self._IncludedImageQuality = 2.0
 				if not self._imagecached:
+					self._getimageinfo()
+					self._makeplan()
+					self._draft()
+					self._stats.stage("detect")
 					self._detectcmykgrayimages()
+					self._stats.stage("downsample")
+					self._pyramid()
 					self._SetDownsampleDimensions()
 					if not self._sizemod and self._CropAndDownsample() == None:
 						# Exception
 						return
+					self._stats.stage("convert")
 					self._ICCtransform()
 					if self._aborted:
 						self._reset()
@@ -2247,14 +3212,15 @@ class OPIparser:
 			
 			channels = len(self._getimage().mode)
 			
+			self._stats.stage("encode")
 			_mode = self.mode.lower()[0]
 			try:
 				if _mode == "b":
 					if self.verbose: self.msg("Getting image data as binary...")
-					imagedata = self._getimage().tostring()
+					imagedata = self._getimagedata()
 				else:
 					if self.verbose: self.msg("Getting image data as hex...")
-					imagedata = binascii.hexlify(self._getimage().tostring())
+					imagedata = binascii.hexlify(self._getimagedata())
 			except Exception, v:
 				self.errorcount += 1
 				self.msg("ERROR - fatal error while reading image: " +
@@ -2273,8 +3239,14 @@ class OPIparser:
 		else:
 			# EPSF
 			self._IncludedImageQuality = 2.0
-			imagedata = self._getimage().data
+			imagedata = None
+			# Samples and bits per sample as given in the job
+			if len(self._ImageType) > 1:
+				channels, bpp = [int(item) for item in self._ImageType[:2]]
+			else:
+				channels, bpp = None, None
 			
+		self._stats.stage("write")
 		self._inc_occurrences()
 		
 		if self._imageformat != "epsf":
@@ -2288,6 +3260,11 @@ class OPIparser:
 					self._ImageColor = [0, 0, 0, 1, "Black"]
 					self._ImageTint = 1.0
 					self._ImageInks = "monochrome 1 (Black) 1.0"
+				elif (not self._ImageColor and
+					  self._ImageInks.startswith("monochrome 1 (Black) ")):
+					# OPI 2.0 job, which has the inks but no color comment
+					self._ImageColorType = "Process"
+					self._ImageColor = [0, 0, 0, 1, "Black"]
 		
 		if 1.3 in self.version:
 			if self.verbose:
@@ -2896,10 +3873,9 @@ class OPIparser:
 			if _mode == "b":
 				self._raw_write(imagedata)
 			else:
-				while imagedata:
-					self._raw_write(imagedata[0:self._getimage().size[0]*2] +
-									self.newline)
-					imagedata = imagedata[self._getimage().size[0]*2:]
+				rowlength = self._getimage().size[0] * 2
+				for i in xrange(0, len(imagedata), rowlength):
+					self._raw_write(imagedata[i:i + rowlength] + self.newline)
 			
 			self._raw_write(self.newline + "%%EndData" + self.newline)
 		
@@ -2909,7 +3885,7 @@ class OPIparser:
 				self._raw_write("tempmatrix setmatrix" + self.newline)
 			self._raw_write("%%BeginDocument: " + self.escapefilename() +
 							self.newline)
-			self._raw_write(imagedata)
+			self._getimage().copyto(self._out)
 			self._raw_write(self.newline + "%%EndDocument" + self.newline)
 
 		if 2.0 in self.version:
@@ -2918,11 +3894,24 @@ class OPIparser:
 		
 		if 1.3 in self.version:
 			self._raw_write("%%EndObject" + self.newline)
+		
+		if not self._aborted:
+			# Object boundary
+			self._out.flush()
 
 		self.msg("...OK")
 		
 		self._checkpurgecache(0)
 
+		self._stats.set(bytesout=self._out.tell() - outstart)
+		imagestats = self._stats.current
+		self._stats.end()
+		if self._metrics:
+			self._updatemetrics(imagestats)
+		
+		if self.profile == "mem" and self._profiler:
+			self.msg(self._profiler.snapshot(path.basename(self._ImageFileName)))
+
 		if self.verbose:
 			self.info()
 		
@@ -2931,35 +3920,176 @@ class OPIparser:
 
 
 class EPSImage:
+	
+	""" EPS file. Only the offset and length of the PostScript section are
+	kept, the PostScript code is streamed from the file when written. """
+	
+	chunksize = 1024 * 1024
+	
 	def __init__(self, filename):
+		self.filename = filename
 		epsf = open(filename, "rb")
-		data = epsf.read()
-		epsf.close()
-		if data[0:4] == "\xC5\xD0\xD3\xC6": # DOS EPS Binary File Header
-			pscodebegin = int(binascii.hexlify(data[4:8][::-1]), 16)
-			pscodelength = int(binascii.hexlify(data[8:12][::-1]), 16)
-			self.data = data[pscodebegin:pscodebegin + pscodelength]
-		elif data[0:2] == "%!": # ASCII EPS
-			self.data = data
-		else:
-			self.data = ""
-		self.format = "EPSF"
-		self.info = {}
-		self.mode = None
-		self.palette = None
-		if self.data:
-			i = self.data.find("%%HiResBoundingBox")
-			if i < 0:
-				i = self.data.find("%%BoundingBox")
-			if i >= 0:
-				bbox = floatlist(self.data[i:i+128].split()[1:5])
-				# %%BoundingBox, x2, y2, x2, y2
-				self.info["boundingbox"] = bbox
-				self.size = (bbox[2] - bbox[0], bbox[3] - bbox[1])
-		else:
+		try:
+			header = epsf.read(12)
+			if header[0:4] == "\xC5\xD0\xD3\xC6": # DOS EPS Binary File Header
+				self.offset = int(binascii.hexlify(header[4:8][::-1]), 16)
+				self.length = int(binascii.hexlify(header[8:12][::-1]), 16)
+			elif header[0:2] == "%!": # ASCII EPS
+				self.offset = 0
+				self.length = os.fstat(epsf.fileno()).st_size
+			else:
+				self.offset = 0
+				self.length = 0
+			self.format = "EPSF"
+			self.info = {}
+			self.mode = None
+			self.palette = None
 			self.size = (0, 0)
-	def tostring(self):
-		return self.data
+			if self.length:
+				bbox = (self._find(epsf, "%%HiResBoundingBox") or
+						self._find(epsf, "%%BoundingBox"))
+				if bbox:
+					bbox = floatlist(bbox.split()[1:5])
+					# %%BoundingBox, x2, y2, x2, y2
+					self.info["boundingbox"] = bbox
+					self.size = (bbox[2] - bbox[0], bbox[3] - bbox[1])
+		finally:
+			epsf.close()
+	
+	def _find(self, epsf, token):
+		""" Find token in the PostScript section, reading it in chunks.
+		Returns the 128 bytes starting at token, or None """
+		pos = 0
+		overlap = ""
+		while pos < self.length:
+			epsf.seek(self.offset + pos)
+			chunk = overlap + epsf.read(min(self.chunksize, self.length - pos))
+			if len(chunk) == len(overlap):
+				break
+			pos += len(chunk) - len(overlap)
+			i = chunk.find(token)
+			if i >= 0:
+				result = chunk[i:i + 128]
+				if len(result) < 128 and pos < self.length:
+					result += epsf.read(min(128 - len(result),
+											self.length - pos))
+				return result
+			overlap = chunk[-len(token):]
+	
+	def iterchunks(self):
+		""" Yield the PostScript section in chunks of chunksize bytes """
+		epsf = open(self.filename, "rb")
+		try:
+			epsf.seek(self.offset)
+			remaining = self.length
+			while remaining > 0:
+				chunk = epsf.read(min(self.chunksize, remaining))
+				if not chunk:
+					break
+				remaining -= len(chunk)
+				yield chunk
+		finally:
+			epsf.close()
+	
+	def copyto(self, out):
+		""" Copy the PostScript section to an OutputBuffer """
+		epsf = open(self.filename, "rb")
+		try:
+			out.copyrange(epsf.fileno(), self.offset, self.length)
+		finally:
+			epsf.close()
+	
+	def tobytes(self):
+		return "".join(self.iterchunks())
+	
+	tostring = tobytes
+
+
+
+class TransformCache:
+	
+	""" Least recently used cache for ImageCms transforms """
+	
+	def __init__(self, maxsize = 32):
+		self.maxsize = maxsize
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._transforms = OrderedDict()
+	
+	def __len__(self):
+		return len(self._transforms)
+	
+	def get(self, key):
+		if key in self._transforms:
+			self.hits += 1
+			# Move to the end (most recently used)
+			transform = self._transforms.pop(key)
+			self._transforms[key] = transform
+			return transform
+		self.misses += 1
+	
+	def set(self, key, transform):
+		""" Add a transform, returns the number of evicted transforms """
+		evicted = 0
+		self._transforms.pop(key, None)
+		while self.maxsize > 0 and len(self._transforms) >= self.maxsize:
+			self._transforms.popitem(last=False)
+			evicted += 1
+		self._transforms[key] = transform
+		self.evictions += evicted
+		return evicted
+	
+	def getstats(self):
+		return ("%i transform(s), %i hit(s), %i miss(es), %i eviction(s)" %
+				(len(self._transforms), self.hits, self.misses,
+				 self.evictions))
+
+
+class ImageInfoCache:
+	
+	""" Persistent store of image analysis results (sqlite), keyed by a
+	fingerprint of the image file (path, size and modification time) """
+	
+	fields = ("mode", "width", "height", "xdpi", "ydpi", "profile_id",
+			  "cmykgray", "rgbgray")
+	
+	def __init__(self, filename):
+		self.filename = filename
+		self._db = sqlite3.connect(filename)
+		self._db.execute("CREATE TABLE IF NOT EXISTS images "
+						 "(fingerprint TEXT PRIMARY KEY, path TEXT, " +
+						 ", ".join(self.fields) + ")")
+	
+	def close(self):
+		self._db.commit()
+		self._db.close()
+	
+	def fingerprint(self, imagepath):
+		st = os.stat(imagepath)
+		return "%s|%i|%i" % (imagepath, st.st_size, int(st.st_mtime))
+	
+	def get(self, imagepath):
+		""" Return the stored information for an image as dict """
+		row = self._db.execute("SELECT " + ", ".join(self.fields) +
+							   " FROM images WHERE fingerprint = ?",
+							   (self.fingerprint(imagepath), )).fetchone()
+		info = {}
+		if row:
+			for key, value in zip(self.fields, row):
+				if value is not None:
+					info[key] = value
+		return info
+	
+	def set(self, imagepath, info):
+		""" Store information for an image, replacing entries for previous
+		versions of the file """
+		fingerprint = self.fingerprint(imagepath)
+		self._db.execute("DELETE FROM images WHERE path = ?", (imagepath, ))
+		self._db.execute("INSERT INTO images VALUES (?, ?, " +
+						 ", ".join("?" * len(self.fields)) + ")",
+						 [fingerprint, imagepath] +
+						 [info.get(key) for key in self.fields])
 
 
 
@@ -3014,10 +4144,14 @@ if __name__=="__main__":
 		if len(a):
 			# ATTENTION: This means all checks below have to be done lowercase!
 			a[0] = a[0].lower()
-		if a[0] == "-preserveblack":
+		if a[0] == "-fastdownsample":
+			opiparser.fastdownsample = True
+		elif a[0] == "-preserveblack":
 			opiparser._ImageCms_flags.append(ImageCms.FLAGS["PRESERVEBLACK"])
 		elif a[0] == "-verbose":
 			opiparser.verbose = True
+		elif a[0] == "-warmup":
+			opiparser.warmup = True
 		elif len(a) == 2:
 			if a[0] == "-abortonfilenotfound":
 				opiparser.abortonfilenotfound = bool(int(a[1]))
@@ -3045,6 +4179,8 @@ if __name__=="__main__":
 				opiparser.ColorImageResolution = float(a[1])
 			elif a[0] == "-colorimageuseembeddedresolution":
 				opiparser.ColorImageUseEmbeddedResolution = bool(int(a[1]))
+			elif a[0] == "-consolelines":
+				opiparser.consolelines = int(a[1])
 			elif a[0] == "-convertcmyk": # legacy
 				opiparser.convertcmykimages = bool(int(a[1]))
 			elif a[0] == "-convertgrayimages":
@@ -3091,6 +4227,8 @@ if __name__=="__main__":
 					fi = unicode(a[1], "utf-8", "replace")
 			elif a[0] == "-imagecropthreshold":
 				opiparser.imagecropthreshold = float(a[1])
+			elif a[0] == "-imageinfocachefile":
+				opiparser.imageinfocachefile = a[1]
 			elif a[0] == "-intent":
 				opiparser.intent = a[1].lower()
 			elif a[0] == "-log":
@@ -3103,6 +4241,14 @@ if __name__=="__main__":
 					opiparser.lorespath = unicode(a[1], "cp437", "replace")
 				else:
 					opiparser.lorespath = unicode(a[1], "utf-8", "replace")
+			elif a[0] == "-loglevel":
+				opiparser.loglevel = a[1].lower()
+			elif a[0] == "-metricsfile":
+				opiparser.metricsfile = a[1]
+			elif a[0] == "-metricsport":
+				opiparser.metricsport = int(a[1])
+			elif a[0] == "-mmapinput":
+				opiparser.mmapinput = bool(int(a[1]))
 			elif a[0] == "-mode":
 				opiparser.mode = a[1].lower()
 			elif a[0] == "-monoimagedownsamplethreshold":
@@ -3141,6 +4287,12 @@ if __name__=="__main__":
 				opiparser.ICCProfiles["out_RGB_gray"].fileName = a[1]
 			elif a[0] == "-outprofile":
 				opiparser.ICCProfiles["out"].fileName = a[1]
+			elif a[0] == "-outputbuffersize":
+				opiparser.outputbuffersize = int(a[1])
+			elif a[0] == "-profile":
+				opiparser.profile = a[1].lower()
+			elif a[0] == "-profilefile":
+				opiparser.profilefile = a[1]
 			elif a[0] == "-proofgrayprofile":
 				opiparser.ICCProfiles["proof_gray"].fileName = a[1]
 			elif a[0] == "-proofintent":
@@ -3149,6 +4301,10 @@ if __name__=="__main__":
 				opiparser.ICCProfiles["proof_RGB_gray"].fileName = a[1]
 			elif a[0] == "-proofprofile":
 				opiparser.ICCProfiles["proof"].fileName = a[1]
+			elif a[0] == "-pyramidcache":
+				opiparser.pyramidcache = a[1].lower()
+			elif a[0] == "-report":
+				opiparser.report = a[1]
 			elif a[0] == "-sameprofiles":
 				opiparser.sameprofiles_sets.append([desc_or_md5.strip('"')
 													for desc_or_md5 in
@@ -3157,12 +4313,20 @@ if __name__=="__main__":
 				opiparser.usecache = bool(int(a[1]))
 			elif a[0] == "-usediskcache":
 				opiparser.usediskcache = bool(int(a[1]))
+			elif a[0] == "-trace":
+				opiparser.trace = a[1]
+			elif a[0] == "-transformlist":
+				opiparser.transformlist = a[1]
+			elif a[0] == "-transformcachesize":
+				opiparser._transforms.maxsize = int(a[1])
 			elif a[0] == "-workingcmykprofile":
 				opiparser.ICCProfiles["working_CMYK"].fileName = a[1]
 			elif a[0] == "-workinggrayprofile":
 				opiparser.ICCProfiles["working_gray"].fileName = a[1]
 			elif a[0] == "-workingrgbprofile":
 				opiparser.ICCProfiles["working_RGB"].fileName = a[1]
+			elif a[0] == "-workers":
+				opiparser.workers = max(1, int(a[1]))
 
 	if (not show_help and fi and fo and opiparser.hirespath and
 		opiparser.lorespath):
@@ -3200,6 +4364,8 @@ if __name__=="__main__":
 		print " -colorimageuseembeddedresolution=[0|1]"
 		print "   0 = use colorimageresolution"
 		print "   1 = use actual resolution if set (default)"
+		print " -consolelines=10000"
+		print "   max number of lines kept in the log window (the log file gets all)"
 		print " -convertgrayimages=[0|1]"
 		print "   0 = do not convert gray images (default)"
 		print "   1 = convert gray images"
@@ -3218,6 +4384,9 @@ if __name__=="__main__":
 		print " -downsamplemonoimages=[0|1] (use along with -monoimageresolution)"
 		print "   0 = do not downsample 1-Bit images (default)"
 		print "   1 = downsample 1-Bit images"
+		print " -fastdownsample"
+		print "   reduce by the largest integer factor with a box filter first, then"
+		print "   apply the downsample filter (faster for large factors, slightly softer)"
 		print " -grayimagedownsamplethreshold=2.0"
 		print " -grayimagedownsampletype=[nearest|bilinear|bicubic|antialias (default)]"
 		print " -grayimageresolution=300.0"
@@ -3228,10 +4397,24 @@ if __name__=="__main__":
 		print "   1 = use actual resolution if set (default)"
 		print " -imagecropthreshold=1.1"
 		print "   treshold above which actual image data is discarded when cropped."
+		print " -imageinfocachefile=\"<path to file>\""
+		print "   remember image analysis results (e.g. CMYK gray and R=G=B detection)"
+		print "   across jobs for unchanged image files"
 		print " -intent=[a|b|p|r|s] (a = absolute, b = relative with black point compensation"
 		print "   p = perceptive [default], r = relative, s = saturation)"
 		print "   intent for image conversion to output colorspace"
 		print " -log=\"<path to logfile>\""
+		print " -loglevel=[debug|info (default)|warning|error]"
+		print "   minimum level of messages to log (-verbose implies debug)"
+		print " -metricsfile=\"<path to file>.prom\""
+		print "   write Prometheus metrics (images, bytes, caches, stage latencies,"
+		print "   errors) after each image, e.g. for the node_exporter textfile collector"
+		print " -metricsport=<port>"
+		print "   serve the same metrics at http://127.0.0.1:<port>/metrics while"
+		print "   the job runs"
+		print " -mmapinput=[0|1]"
+		print "   0 = read input file line by line"
+		print "   1 = memory map input file and skip ahead to relevant comments (default)"
 		print " -mode=[a|b]"
 		print "   output mode for inserted image data"
 		print "   a = ASCII"
@@ -3252,8 +4435,19 @@ if __name__=="__main__":
 		print "   icc profile for converting 'R=G=B' images to output colorspace"
 		print " -outprofile=\"profile.icc\""
 		print "   icc profile for converting color images to output colorspace"
+		print " -outputbuffersize=1048576"
+		print "   bytes of output to collect before writing (written at the latest"
+		print "   after each image)"
 		print " -preserveblack"
 		print "   preserve black channel as much as possible when converting CMYK to CMYK"
+		print " -profile=[cpu|mem]"
+		print "   cpu = profile the job with cProfile, log the top functions and save"
+		print "         the statistics for pstats (see -profilefile)"
+		print "   mem = log memory usage after each image, and the peak and top"
+		print "         allocation sites (tracemalloc if available) at the end"
+		print " -profilefile=\"<path to file>\""
+		print "   where -profile=cpu saves the statistics (default: log file or"
+		print "   output file name with extension .pstats)"
 		print " -proofintent=[a|b|p|r|s] (a = absolute, b = relative with black point"
 		print "  compensation, p = perceptive [default], r = relative, s = saturation)"
 		print "   intent for conversion to proofing colorspace"
@@ -3263,17 +4457,36 @@ if __name__=="__main__":
 		print "   icc profile for converting 'R=G=B' images to proofing colorspace"
 		print " -proofprofile=\"profile.icc\""
 		print "   icc profile for converting color images to proofing colorspace"
+		print " -pyramidcache=[memory|disk]"
+		print "   keep power-of-two reductions of downsampled images in the RAM cache"
+		print "   (and in a 'pyramid' directory next to the image) for other placements"
+		print " -report=\"<path to file>.json\" or \"<path to file>.csv\""
+		print "   write wall/CPU time per processing stage, bytes in/out and cache"
+		print "   source of each image (the job summary is always logged)"
 		print " -sameprofiles=\"Profile Description\"[,\"Profile Description\"[,...]]"
 		print "   ICC Profiles which match the description(s) will be treated as identical"
 		print "   (e.g. no color conversion will occur between them)"
 		print " -sameprofiles=MD5[,MD5[,...]]"
 		print "   ICC Profiles which match the MD5 checksum(s) will be treated as identical"
 		print "   (e.g. no color conversion will occur between them)"
+		print " -trace=\"<path to file>.json\""
+		print "   write Chrome trace events (stages, cache hits/evictions, worker threads)"
+		print "   for chrome://tracing or the Perfetto UI"
+		print " -transformlist=\"<path to file>\""
+		print "   list the color transforms used by a job in this file and build them"
+		print "   again when the next job starts (the transforms are not stored)"
+		print " -transformcachesize=32"
+		print "   max number of color transforms to keep (0 = unlimited)"
 		print " -usecache=[0|1]"
 		print "   0 = do not use RAM cache for images"
 		print "   1 = use RAM cache for images"
 		print " -verbose"
 		print "   verbose logging"
+		print " -warmup"
+		print "   prebuild color transforms in the background when the job starts"
+		print " -workers=1"
+		print "   number of threads to use for color converting and downsampling"
+		print "   (antialias filter only) images in bands"
 		print " -workingCMYKProfile=\"profile.icc\""
 		print "   profile to use for color converting CMYK images without embedded profile"
 		print " -workingGrayProfile=\"profile.icc\""
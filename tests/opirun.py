@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+""" Run opi.py on synthetic jobs (see bench/makejob.py) in the tests """
+
+import os
+import re
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, "bench"))
+
+import makejob
+import opi
+
+
+def makeparser(job, hires, output, **options):
+	"""
+	Set up an OPIparser for job, ready to run main().
+
+	Like OPIparser.parse(), but without the log window, so main() runs in
+	the calling thread.
+
+	"""
+	parser = opi.OPIparser()
+	parser.hirespath = hires
+	parser.lorespath = "/" + "/".join(makejob.lorespath)
+	parser.ColorImageUseEmbeddedResolution = False
+	parser.GrayImageUseEmbeddedResolution = False
+	for name, value in options.iteritems():
+		setattr(parser, name, value)
+	parser._fi = open(job, "rb")
+	parser._fo = open(output, "wb")
+	parser._out = opi.OutputBuffer(parser._fo, parser.outputbuffersize)
+	return parser
+
+
+def run(job, hires, output, **options):
+	""" Process job with opi.py, returns the parser """
+	parser = makeparser(job, hires, output, **options)
+	parser.main()
+	assert not parser.errorcount
+	return parser
+
+
+def process(job, hires, output, **options):
+	""" Process job with opi.py, returns the output """
+	run(job, hires, output, **options)
+	data = open(output, "rb").read()
+	assert data
+	return data
+
+
+def geometry(data):
+	""" Crop rectangle and included image size of each placement """
+	return zip(re.findall(r"^%ALDImageCropRect: (.+?)\r?$", data, re.M),
+			   re.findall(r"^%%IncludedImageDimensions: (.+?)\r?$", data,
+						  re.M))
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+# opi.py needs wxPython
+pytest.importorskip("wx")
+
+# Also puts opi and makejob on the import path
+from opirun import geometry, process, run
+
+import makejob
+
+
+@pytest.fixture
+def job(tmpdir):
+	# Two placements of one JPEG at 1440 dpi, which is downsampled to
+	# 300 dpi from a 1/4 scale decode. 1440 dpi gives a placed size without
+	# rounding errors, so both placements have the same cache key.
+	return makejob.makejob(str(tmpdir.join("job")), placements=2, repeats=2,
+						   crop=.6, formats=("jpeg", ), modes=("RGB", ),
+						   dpi=1440)
+
+
+def test_draft_repeat_cached(tmpdir, job):
+	parser = run(job["job"], job["hires"], str(tmpdir.join("out.ps")))
+	first, second = parser._stats.images
+	assert "downsample" in first.wall
+	assert second.cache == "memory"
+	assert "downsample" not in second.wall
+
+
+def test_draft_geometry(tmpdir, job):
+	# Same crop rectangles and sizes as decoding the JPEG at full size,
+	# which the image pyramid needs
+	expected = geometry(process(job["job"], job["hires"],
+								str(tmpdir.join("out-full.ps")),
+								pyramidcache="memory"))
+	result = geometry(process(job["job"], job["hires"],
+							  str(tmpdir.join("out.ps"))))
+	assert len(result) == 2
+	assert result == expected
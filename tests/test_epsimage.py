@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+from cStringIO import StringIO
+import struct
+
+import pytest
+
+# opi.py needs wxPython
+pytest.importorskip("wx")
+
+# Also puts opi on the import path
+import opirun
+
+from opi import EPSImage, OutputBuffer
+
+
+def makeeps(bbox="%%BoundingBox: 0 0 100 50", size=1000):
+	lines = ["%!PS-Adobe-3.0 EPSF-3.0", "%%Creator: test", bbox,
+			 "%%EndComments"]
+	i = 0
+	while sum(len(line) + 1 for line in lines) < size:
+		lines.append("%i %i moveto" % (i, i))
+		i += 1
+	lines.append("%%EOF")
+	return "\n".join(lines) + "\n"
+
+
+def makedoseps(postscript, preview="TIFF preview"):
+	""" DOS EPS binary file with a preview before the PostScript section """
+	offset = 30 + len(preview)
+	header = struct.pack("<4s6IH", "\xC5\xD0\xD3\xC6", offset,
+						 len(postscript), 0, 0, 30, len(preview), 0xFFFF)
+	return header + preview + postscript + "trailing data"
+
+
+@pytest.fixture(params=[False, True], ids=["ascii", "dos"])
+def eps(request, tmpdir, monkeypatch):
+	# A small chunk size to read the PostScript section in many chunks
+	monkeypatch.setattr(EPSImage, "chunksize", 64)
+	postscript = makeeps()
+	if request.param:
+		data = makedoseps(postscript)
+	else:
+		data = postscript
+	tmpdir.join("image.eps").write(data, "wb")
+	return EPSImage(str(tmpdir.join("image.eps"))), postscript
+
+
+def test_header(eps):
+	image, postscript = eps
+	assert image.length == len(postscript)
+	assert image.info["boundingbox"] == [0, 0, 100, 50]
+	assert image.size == (100, 50)
+
+
+def test_iterchunks(eps):
+	image, postscript = eps
+	chunks = list(image.iterchunks())
+	assert len(chunks) == (len(postscript) + 63) // 64
+	assert max(len(chunk) for chunk in chunks) == 64
+	assert "".join(chunks) == postscript
+	assert image.tobytes() == image.tostring() == postscript
+
+
+def test_copyto(tmpdir, eps):
+	image, postscript = eps
+	fileobj = open(str(tmpdir.join("out.ps")), "wb")
+	out = OutputBuffer(fileobj, 16)
+	out.write("before\n")
+	image.copyto(out)
+	out.write("after\n")
+	out.flush()
+	fileobj.close()
+	assert (tmpdir.join("out.ps").read("rb") ==
+			"before\n" + postscript + "after\n")
+
+
+def test_token_across_chunks(tmpdir, monkeypatch):
+	monkeypatch.setattr(EPSImage, "chunksize", 64)
+	postscript = makeeps("%%HiResBoundingBox: 0.5 1 100.25 50.5")
+	for pad in xrange(64):
+		# Move the token across the chunk boundaries
+		data = postscript.replace("\n", "\n%" + "x" * pad + "\n", 1)
+		tmpdir.join("image.eps").write(data, "wb")
+		image = EPSImage(str(tmpdir.join("image.eps")))
+		assert image.info["boundingbox"] == [0.5, 1, 100.25, 50.5], pad
+
+
+def test_not_eps(tmpdir):
+	tmpdir.join("image.eps").write("GIF89a", "wb")
+	image = EPSImage(str(tmpdir.join("image.eps")))
+	assert image.length == 0
+	assert image.size == (0, 0)
+	assert image.tobytes() == ""
+	out = StringIO()
+	image.copyto(OutputBuffer(out, 16))
+	assert out.getvalue() == ""
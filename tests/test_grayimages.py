@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from PIL import Image
+
+# opi.py needs wxPython
+pytest.importorskip("wx")
+
+# Also puts opi on the import path
+import opirun
+
+import opi
+
+
+def makeparser(image):
+	parser = opi.OPIparser()
+	parser._reset()
+	# Not running a job, so nothing to log to
+	parser.msg = lambda *args, **kwargs: None
+	parser._imgASCIIpath = "image.tif"
+	parser._imageformat = "tiff"
+	parser._set_imgpath_md5(parser._imgASCIIpath)
+	parser._setimage(image)
+	return parser
+
+
+def konly(size=(64, 48)):
+	""" CMYK image with only K set """
+	k = Image.linear_gradient("L").resize(size)
+	blank = Image.new("L", size)
+	return Image.merge("CMYK", (blank, blank, blank, k))
+
+
+@pytest.mark.parametrize("channel", [0, 1, 2])
+def test_iscmykgray(channel):
+	image = konly()
+	assert makeparser(image)._iscmykgray()
+	# A single pixel away from the five sample pixels
+	pixel = [0, 0, 0, 128]
+	pixel[channel] = 1
+	image.putpixel((1, 47), tuple(pixel))
+	assert not makeparser(image)._iscmykgray()
+
+
+def test_iscmykgray_sample():
+	image = konly()
+	image.putpixel((32, 24), (0, 0, 255, 0))
+	parser = makeparser(image)
+	histogram = []
+	parser._getimage().histogram = lambda: histogram.append(1)
+	assert not parser._iscmykgray()
+	# The whole image is not looked at
+	assert not histogram
+
+
+def test_stripcmy():
+	image = konly()
+	parser = makeparser(image)
+	parser.detectcmykgrayimages = True
+	parser.cmykgrayimages_stripcmy = True
+	parser._detectcmykgrayimages()
+	assert parser._iscmykgrayimage
+	result = parser._getimage()
+	assert result.mode == "L"
+	# K is inverted to gray
+	assert result.getpixel((0, 0)) == 255 - image.getpixel((0, 0))[3]
+	assert result.getpixel((0, 47)) == 255 - image.getpixel((0, 47))[3]
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+# opi.py needs wxPython
+pytest.importorskip("wx")
+
+# Also puts opi and makejob on the import path
+from opirun import run
+
+import makejob
+import opi
+
+
+def test_plan_from_cache(tmpdir, monkeypatch):
+	job = makejob.makejob(str(tmpdir.join("job")), placements=2,
+						  crop=.6, formats=("tiff", ), modes=("RGB", "L"))
+	cachefile = str(tmpdir.join("imageinfo.sqlite"))
+	plans = []
+	calls = []
+	_makeplan = opi.OPIparser._makeplan
+	def makeplan(self):
+		_makeplan(self)
+		plans.append(self._imageplan)
+	_getimageinfo = opi.OPIparser._getimageinfo
+	def getimageinfo(self):
+		calls.append(0)
+		_getimageinfo(self)
+		calls.append(1)
+	_getimage = opi.OPIparser._getimage
+	def getimage(self):
+		if calls and not calls[-1]:
+			raise AssertionError("image header read for image info")
+		return _getimage(self)
+	monkeypatch.setattr(opi.OPIparser, "_makeplan", makeplan)
+	monkeypatch.setattr(opi.OPIparser, "_getimageinfo", getimageinfo)
+	run(job["job"], job["hires"], str(tmpdir.join("out.ps")))
+	expected = plans[:]
+	assert len(expected) == 2
+	for plan in expected:
+		assert plan["crop"]
+		assert not plan["passthrough"]
+	# The first run stores the image info
+	del plans[:]
+	run(job["job"], job["hires"], str(tmpdir.join("out.ps")),
+		imageinfocachefile=cachefile)
+	assert plans == expected
+	# The second run plans from it, without looking at the image header
+	del plans[:], calls[:]
+	monkeypatch.setattr(opi.OPIparser, "_getimage", getimage)
+	run(job["job"], job["hires"], str(tmpdir.join("out.ps")),
+		imageinfocachefile=cachefile)
+	assert calls == [0, 1, 0, 1]
+	assert plans == expected
+
+
+@pytest.fixture
+def cache(tmpdir):
+	cache = opi.ImageInfoCache(str(tmpdir.join("imageinfo.sqlite")))
+	yield cache
+	cache.close()
+
+
+def test_cache_get_set(tmpdir, cache):
+	image = tmpdir.join("image.tif")
+	image.write("data")
+	assert cache.get(str(image)) == {}
+	cache.set(str(image), {"mode": "CMYK", "width": 10, "height": 20,
+						   "cmykgray": True, "unknown": 1})
+	assert cache.get(str(image)) == {"mode": "CMYK", "width": 10,
+									 "height": 20, "cmykgray": True}
+
+
+def test_cache_invalidation(tmpdir, cache):
+	image = tmpdir.join("image.tif")
+	image.write("data")
+	image.setmtime(1000000000)
+	cache.set(str(image), {"mode": "L"})
+	# Changed modification time
+	image.setmtime(1000000001)
+	assert cache.get(str(image)) == {}
+	image.setmtime(1000000000)
+	assert cache.get(str(image)) == {"mode": "L"}
+	# Changed size, same modification time
+	image.write("more data")
+	image.setmtime(1000000000)
+	assert cache.get(str(image)) == {}
+
+
+def test_cache_replace(tmpdir, cache):
+	image = tmpdir.join("image.tif")
+	image.write("data")
+	image.setmtime(1000000000)
+	cache.set(str(image), {"mode": "L"})
+	image.setmtime(1000000001)
+	cache.set(str(image), {"mode": "RGB"})
+	# The entry for the previous version of the file is gone
+	assert cache._db.execute("SELECT COUNT(*) FROM images").fetchone() == (1, )
+	image.setmtime(1000000000)
+	assert cache.get(str(image)) == {}
+	image.setmtime(1000000001)
+	assert cache.get(str(image)) == {"mode": "RGB"}
+	# Other files are kept
+	other = tmpdir.join("other.tif")
+	other.write("data")
+	cache.set(str(other), {"mode": "1"})
+	assert cache.get(str(image)) == {"mode": "RGB"}
+	assert cache.get(str(other)) == {"mode": "1"}
+
+
+def test_cache_persistent(tmpdir):
+	image = tmpdir.join("image.tif")
+	image.write("data")
+	cache = opi.ImageInfoCache(str(tmpdir.join("imageinfo.sqlite")))
+	cache.set(str(image), {"mode": "RGB", "rgbgray": False})
+	cache.close()
+	cache = opi.ImageInfoCache(str(tmpdir.join("imageinfo.sqlite")))
+	try:
+		assert cache.get(str(image)) == {"mode": "RGB", "rgbgray": False}
+	finally:
+		cache.close()
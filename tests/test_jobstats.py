@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+	os.path.abspath(__file__))), "lib"))
+
+import JobStats
+from JobStats import JobStats as Stats
+
+
+class Clock(object):
+
+	""" Wall and CPU time advanced by the test """
+
+	def __init__(self):
+		self.wall = 100.0
+		self.cpu = 10.0
+
+	def advance(self, wall, cpu):
+		self.wall += wall
+		self.cpu += cpu
+
+
+@pytest.fixture
+def clock(monkeypatch):
+	clock = Clock()
+	monkeypatch.setattr(JobStats, "time", lambda: clock.wall)
+	monkeypatch.setattr(JobStats, "cputime", lambda: clock.cpu)
+	return clock
+
+
+class TraceLog(object):
+
+	def __init__(self):
+		self.events = []
+
+	def begin(self, name, cat="", **args):
+		self.events.append(("B", name, cat, args))
+
+	def end(self, name, cat="", **args):
+		self.events.append(("E", name, cat, args))
+
+
+@pytest.fixture
+def stats(clock):
+	stats = Stats()
+	stats.begin(u"a.tif")
+	stats.stage("open")
+	clock.advance(1.0, .5)
+	stats.stage("downsample")
+	clock.advance(2.0, 4.0)
+	# Back to a stage which ran before
+	stats.stage("open")
+	clock.advance(.5, .25)
+	stats.set(bytesin=1000, bytesout=100, cache="file")
+	stats.begin(u"b\xe4.tif")
+	stats.stage("write")
+	clock.advance(.5, .5)
+	stats.stage(None)
+	# Not counted
+	clock.advance(1.0, 0)
+	stats.set(bytesin=2000, bytesout=200, cache="memory")
+	return stats
+
+
+def test_stages(stats):
+	first, second = stats.images
+	assert first.wall == {"open": 1.5, "downsample": 2.0}
+	assert first.cpu == {"open": .75, "downsample": 4.0}
+	assert second.wall == {"write": .5}
+	assert first.totalwall() == 3.5
+	assert first.totalcpu() == 4.75
+	assert (second.bytesin, second.bytesout, second.cache) == (2000, 200,
+															   "memory")
+
+
+def test_summary(stats, clock):
+	lines = stats.summary()
+	assert lines[0] == "Stage            Wall (s)    CPU (s) Wall %"
+	assert "Open/decode         1.500      0.750  30.0%" in lines
+	assert "Downsample          2.000      4.000  40.0%" in lines
+	assert "Write               0.500      0.500  10.0%" in lines
+	assert "Crop                0.000      0.000   0.0%" in lines
+	assert lines[-2] == "Job                 5.000      5.250"
+	assert lines[-1] == ("2 object(s), 3000 bytes in, 300 bytes out, "
+						 "source: 1 file, 1 memory")
+	verbose = stats.summary(True)
+	assert verbose[-2:] == [u"   3.500 s    4.750 s CPU file   a.tif",
+							u"   0.500 s    0.500 s CPU memory b\xe4.tif"]
+
+
+def test_write_csv(tmpdir, stats):
+	stats.write(str(tmpdir.join("report.csv")))
+	rows = list(csv.DictReader(open(str(tmpdir.join("report.csv")), "rb")))
+	assert [row["name"] for row in rows] == ["a.tif", "b\xc3\xa4.tif"]
+	assert rows[0]["cache"] == "file"
+	assert float(rows[0]["wall"]) == 3.5
+	assert float(rows[0]["downsample_cpu"]) == 4.0
+	assert float(rows[0]["write_wall"]) == 0
+	assert int(rows[1]["bytes_in"]) == 2000
+
+
+def test_write_json(tmpdir, stats):
+	stats.write(str(tmpdir.join("report.json")))
+	report = json.load(open(str(tmpdir.join("report.json")), "rb"))
+	assert report["wall"] == 5.0
+	assert report["cpu"] == 5.25
+	assert report["stages"] == [name for name, title in JobStats.stages]
+	assert [image["name"] for image in report["images"]] == [u"a.tif",
+															 u"b\xe4.tif"]
+	assert report["images"][0]["open_wall"] == 1.5
+	assert report["images"][1]["cache"] == "memory"
+
+
+def test_tracelog(clock):
+	tracelog = TraceLog()
+	stats = Stats(tracelog)
+	stats.begin("a.tif")
+	stats.stage("open")
+	stats.stage("write")
+	stats.set(bytesin=10, bytesout=1, cache="file")
+	stats.end()
+	assert tracelog.events == [
+		("B", "OPI object", "object", {"image": "a.tif"}),
+		("B", "open", "stage", {}),
+		("E", "open", "stage", {}),
+		("B", "write", "stage", {}),
+		("E", "write", "stage", {}),
+		("E", "OPI object", "object", {"cache": "file", "bytes_in": 10,
+									   "bytes_out": 1})]
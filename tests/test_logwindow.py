@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+from collections import deque
+from thread import allocate_lock
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("wx")
+
+from lib.LogWindow import LogWindow
+
+
+class TextCtrl(object):
+
+	""" The parts of wx.TextCtrl used by LogWindow """
+
+	def __init__(self):
+		self.value = ""
+
+	def Freeze(self):
+		pass
+
+	def Thaw(self):
+		pass
+
+	def AppendText(self, text):
+		self.value += text
+
+	def GetNumberOfLines(self):
+		return self.value.count("\n") + 1
+
+	def XYToPosition(self, x, y):
+		if y >= self.GetNumberOfLines():
+			return -1
+		return len("\n".join(self.value.split("\n")[:y])) + bool(y) + x
+
+	def Remove(self, start, end):
+		assert 0 <= start <= end
+		self.value = self.value[:start] + self.value[end:]
+
+
+@pytest.fixture
+def window(monkeypatch):
+	# Only the ring buffer, the frame and timer need a running wx app
+	def __init__(self, maxlines):
+		self.format = ""
+		self.maxlines = maxlines
+		self._pending = deque()
+		self._pendinglines = 0
+		self._lock = allocate_lock()
+		self._linecount = 0
+		self.log = TextCtrl()
+	monkeypatch.setattr(LogWindow, "__init__", __init__)
+	return LogWindow(10)
+
+
+def test_trim(window):
+	for i in xrange(25):
+		window.write("line %i" % i)
+		window.OnTimer(None)
+	assert window.log.value == "".join("line %i\n" % i for i in xrange(15, 25))
+
+
+def test_multiline_entries(window):
+	window.write("first")
+	window.OnTimer(None)
+	# More lines in one batch than the text control holds. The oldest entry
+	# is dropped from the queue.
+	for i in xrange(4):
+		window.write("\n".join("entry %i line %i" % (i, j) for j in xrange(3)))
+	window.OnTimer(None)
+	entries = "".join("entry %i line %i\n" % (i, j) for i in xrange(1, 4)
+					  for j in xrange(3))
+	assert window.log.value == "first\n" + entries
+	window.write("last")
+	window.OnTimer(None)
+	assert window.log.value == entries + "last\n"
+
+
+def test_long_entry(window):
+	window.write("first")
+	window.OnTimer(None)
+	window.write("\n".join("line %i" % i for i in xrange(30)))
+	window.OnTimer(None)
+	assert window.log.value == "".join("line %i\n" % i for i in xrange(20, 30))
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import socket
+import time
+
+import pytest
+
+# opi.py needs wxPython
+pytest.importorskip("wx")
+
+# Also puts opi and makejob on the import path
+from opirun import makeparser, run
+
+import makejob
+import opi
+
+
+@pytest.fixture
+def job(tmpdir):
+	return makejob.makejob(str(tmpdir.join("job")), placements=1,
+						   formats=("tiff", ), modes=("L", ),
+						   size=(240, 160))
+
+
+def test_unhandled_exception_logged(tmpdir, monkeypatch, job):
+	# Log lines still queued for the writer thread, including the traceback,
+	# are written before main() returns
+	def _processline(self, line):
+		raise RuntimeError("test failure")
+	monkeypatch.setattr(opi.OPIparser, "_processline", _processline)
+	log = str(tmpdir.join("job.log"))
+	parser = makeparser(job["job"], job["hires"], str(tmpdir.join("out.ps")),
+						log=log)
+	parser.main()
+	assert parser._logqueue is None
+	data = open(log, "rb").read()
+	assert "ERROR - unhandled exception" in data
+	assert "RuntimeError: test failure" in data
+
+
+def test_metrics_server_closed(tmpdir, job):
+	# The metrics server stops with the job, so the next one can bind the
+	# same port
+	sock = socket.socket()
+	sock.bind(("127.0.0.1", 0))
+	port = sock.getsockname()[1]
+	sock.close()
+	for i in xrange(2):
+		parser = run(job["job"], job["hires"], str(tmpdir.join("out.ps")),
+					 metricsport=port)
+		assert parser._metrics
+		assert parser._metricsserver is None
+
+
+def test_warmup_joined(tmpdir, monkeypatch, job):
+	# The transform list is only written after the warm-up thread
+	# has finished adding transforms
+	def _warmup(self):
+		time.sleep(.5)
+		self._transformrecipes.append(("in.icc", "out.icc", None, "RGB",
+									   "CMYK", 1, 3, 512))
+	monkeypatch.setattr(opi.OPIparser, "_warmup", _warmup)
+	listfile = tmpdir.join("transforms.txt")
+	run(job["job"], job["hires"], str(tmpdir.join("out.ps")), warmup=True,
+		transformlist=str(listfile))
+	assert listfile.read() == "in.icc\tout.icc\t\tRGB\tCMYK\t1\t3\t512\n"
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+	os.path.abspath(__file__))), "bench"))
+
+import makejob
+
+
+@pytest.mark.parametrize("flavor,comment", [("1.3", "%ALDImageFileName: "),
+											("2.0", "%%ImageFileName: (")])
+def test_makejob(tmpdir, flavor, comment):
+	job = makejob.makejob(str(tmpdir), flavor, pages=2, placements=5,
+						  repeats=3, size=(120, 80), dpi=300,
+						  formats=("tiff", "jpeg", "png", "eps"))
+	assert job["job"] == str(tmpdir.join("job.ps"))
+	assert job["hires"] == str(tmpdir.join("hires"))
+	assert job["placements"] == 10
+	# Each image is placed up to three times, round robin
+	assert job["images"] == 4
+	files = sorted(os.listdir(job["hires"]))
+	# CMYK PNG and 1-bit JPEG are written as TIFF
+	assert files == ["img0001-L.tif", "img0002-RGB.jpg", "img0003-CMYK.tif",
+					 "img0004-1.eps"]
+	assert job["imagebytes"] == sum(os.path.getsize(os.path.join(job["hires"],
+																 name))
+									for name in files)
+	for name in files[:3]:
+		image = Image.open(os.path.join(job["hires"], name))
+		assert image.size == (120, 80)
+		assert image.mode == name.split("-")[1].split(".")[0]
+	data = open(job["job"], "rb").read()
+	assert len(data) == job["jobbytes"]
+	assert data.count("%%Page: ") == 2
+	placed = re.findall(re.escape(comment) + r"Bench:Lowres:(\S+?)\)?$", data,
+						re.M)
+	assert placed == [files[i % 4] for i in xrange(10)]
+
+
+def test_crop(tmpdir):
+	job = makejob.makejob(str(tmpdir), placements=1, crop=.5, size=(120, 80),
+						  dpi=240, newline="\r\n")
+	data = open(job["job"], "rb").read()
+	assert "\r\n%ALDImageCropRect: 30 20 90 60\r\n" in data
+	# 60 x 40 pixels placed at 240 dpi
+	assert "\r\n36.0000 36.0000 translate 18.0000 12.0000 scale\r\n" in data
+	assert not re.search("[^\r]\n", data)
+
+
+def test_parseargs():
+	assert makejob.parseargs(["-pages=2", "-Crop=0.5", "-flavor=2.0",
+							  "-newline=CRLF", "-formats=TIFF, eps",
+							  "-modes=RGB,CMYK", "-size=600x400"]) == {
+		"pages": 2, "crop": .5, "flavor": "2.0", "newline": "\r\n",
+		"formats": ("tiff", "eps"), "modes": ("RGB", "CMYK"),
+		"size": (600, 400)}
+	with pytest.raises(ValueError):
+		makejob.parseargs(["-colors=4"])
+
+
+@pytest.mark.parametrize("flavor", ["1.3", "2.0"])
+def test_process(tmpdir, flavor):
+	# opi.py needs wxPython
+	pytest.importorskip("wx")
+	from opirun import process
+	job = makejob.makejob(str(tmpdir.join("job")), flavor, placements=4,
+						  size=(240, 160), dpi=600)
+	data = process(job["job"], job["hires"], str(tmpdir.join("out.ps")))
+	# One image of each mode, the 1-bit image is an EPS file
+	assert data.count("%%IncludedImageDimensions: ") == 3
+	assert data.count("%%BeginDocument") == 1
+	assert "Bench:Lowres" not in data
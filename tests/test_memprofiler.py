@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+	os.path.abspath(__file__))), "lib"))
+
+import MemProfiler
+from MemProfiler import MemProfiler as Profiler
+
+
+class Snapshot(object):
+
+	def __init__(self, current):
+		self.current = current
+
+	def statistics(self, key_type):
+		assert key_type == "lineno"
+		return ["site %i: %i B" % (i, self.current / (i + 1))
+				for i in xrange(5)]
+
+
+class Tracemalloc(object):
+
+	""" The parts of the tracemalloc module used by MemProfiler """
+
+	def __init__(self):
+		self.memory = [(0, 0)]
+		self.tracing = False
+
+	def start(self):
+		self.tracing = True
+
+	def stop(self):
+		self.tracing = False
+
+	def get_traced_memory(self):
+		return self.memory.pop(0)
+
+	def take_snapshot(self):
+		return Snapshot(self.current)
+
+	def reset_peak(self):
+		pass
+
+
+def test_rss(monkeypatch):
+	monkeypatch.setattr(MemProfiler, "tracemalloc", None)
+	rss = [3 * 1048576, 5 * 1048576, 5 * 1048576]
+	monkeypatch.setattr(MemProfiler, "maxrss", lambda: rss.pop(0))
+	profiler = Profiler(3)
+	assert profiler.snapshot("a.tif") == "Memory: peak RSS 3.0 MB"
+	assert profiler.snapshot("b.tif") == "Memory: peak RSS 5.0 MB"
+	# The peak is attributed to where it was first seen
+	profiler.snapshot("c.tif")
+	lines = profiler.report()
+	assert lines[:2] == ["Peak RSS: 5.0 MB (b.tif)",
+						 "tracemalloc not available, most common object "
+						 "types:"]
+	assert len(lines) == 5
+	counts = [int(line.split()[0]) for line in lines[2:]]
+	assert counts == sorted(counts, reverse=True)
+	profiler.close()
+
+
+def test_rss_not_available(monkeypatch):
+	monkeypatch.setattr(MemProfiler, "tracemalloc", None)
+	monkeypatch.setattr(MemProfiler, "maxrss", lambda: None)
+	profiler = Profiler()
+	assert (profiler.snapshot("a.tif") ==
+			"Memory: not available on this platform")
+	assert profiler.report()[0].startswith("tracemalloc not available")
+
+
+def test_maxrss():
+	if MemProfiler.resource:
+		assert MemProfiler.maxrss() > 1048576
+	else:
+		assert MemProfiler.maxrss() is None
+
+
+def test_tracemalloc(monkeypatch):
+	tracemalloc = Tracemalloc()
+	monkeypatch.setattr(MemProfiler, "tracemalloc", tracemalloc)
+	profiler = Profiler(2)
+	assert tracemalloc.tracing
+	tracemalloc.memory = [(1048576, 2 * 1048576), (4 * 1048576, 8 * 1048576),
+						  (2 * 1048576, 3 * 1048576)]
+	for label, current in (("a.tif", 1048576), ("b.tif", 4 * 1048576),
+						   ("c.tif", 2 * 1048576)):
+		tracemalloc.current = current
+		line = profiler.snapshot(label)
+	assert line == "Memory: 2.0 MB traced, peak 3.0 MB"
+	# The snapshot with the most traced memory is kept
+	assert profiler.report() == ["Peak traced memory: 8.0 MB (b.tif)",
+								 "Top allocation sites at 4.0 MB traced:",
+								 "  site 0: 4194304 B",
+								 "  site 1: 2097152 B"]
+	profiler.close()
+	assert not tracemalloc.tracing
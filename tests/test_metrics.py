@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import os
+import socket
+import sys
+import urllib2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+	os.path.abspath(__file__))), "lib"))
+
+from Metrics import Metrics, MetricsServer
+
+
+def freeport():
+	sock = socket.socket()
+	sock.bind(("127.0.0.1", 0))
+	port = sock.getsockname()[1]
+	sock.close()
+	return port
+
+
+def metrics():
+	metrics = Metrics()
+	metrics.counter("opi_jobs_total", "Jobs processed")
+	metrics.gauge("opi_image_cache_bytes", "Memory cache size in bytes")
+	metrics.histogram("opi_image_duration_seconds", "Wall time per image",
+					  (.1, 1))
+	return metrics
+
+
+def test_render():
+	m = metrics()
+	m.inc("opi_jobs_total", status="ok")
+	m.inc("opi_jobs_total", status="ok")
+	m.inc("opi_jobs_total", status='a "b"\n')
+	m.set("opi_image_cache_bytes", 1024)
+	m.observe("opi_image_duration_seconds", .05)
+	m.observe("opi_image_duration_seconds", .5)
+	assert m.render().splitlines() == [
+		"# HELP opi_jobs_total Jobs processed",
+		"# TYPE opi_jobs_total counter",
+		'opi_jobs_total{status="ok"} 2',
+		'opi_jobs_total{status="a \\"b\\"\\n"} 1',
+		"# HELP opi_image_cache_bytes Memory cache size in bytes",
+		"# TYPE opi_image_cache_bytes gauge",
+		"opi_image_cache_bytes 1024",
+		"# HELP opi_image_duration_seconds Wall time per image",
+		"# TYPE opi_image_duration_seconds histogram",
+		'opi_image_duration_seconds_bucket{le="0.1"} 1',
+		'opi_image_duration_seconds_bucket{le="1"} 2',
+		'opi_image_duration_seconds_bucket{le="+Inf"} 2',
+		"opi_image_duration_seconds_sum 0.55",
+		"opi_image_duration_seconds_count 2"]
+
+
+def test_writetextfile(tmpdir):
+	m = metrics()
+	m.inc("opi_jobs_total")
+	filename = str(tmpdir.join("opi.prom"))
+	for i in xrange(2):
+		# Replaces the existing file
+		m.writetextfile(filename)
+	assert open(filename, "rb").read() == m.render()
+	assert tmpdir.listdir() == [tmpdir.join("opi.prom")]
+
+
+def test_server():
+	m = metrics()
+	m.inc("opi_jobs_total")
+	port = freeport()
+	for i in xrange(2):
+		# The port can be used again after close()
+		server = MetricsServer(m, port)
+		try:
+			url = "http://127.0.0.1:%i/metrics" % port
+			assert urllib2.urlopen(url).read() == m.render()
+		finally:
+			server.close()
+	assert not server._thread.isAlive()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+
+import pytest
+from PIL import Image, ImageCms
+
+# opi.py needs wxPython
+pytest.importorskip("wx")
+
+# Also puts opi on the import path
+import opirun
+
+import opi
+
+
+def profiledata(colorspace="sRGB"):
+	profile = ImageCms.ImageCmsProfile(ImageCms.createProfile(colorspace))
+	if hasattr(profile, "tobytes"):
+		return profile.tobytes()
+	return ImageCms.core.profile_tobytes(profile.profile)
+
+
+def test_embedded_in_memory(tmpdir, monkeypatch):
+	monkeypatch.setattr(tempfile, "tempdir", str(tmpdir))
+	parser = opi.OPIparser()
+	data = profiledata()
+	profile = parser._getembeddedprofile(data)
+	# Parsed once, the same profile is returned for the same data
+	assert parser._getembeddedprofile(data) is profile
+	assert parser._getembeddedprofile(profiledata("LAB")) is not profile
+	assert len(parser._embeddedprofiles) == 2
+	# Nothing written to the temp directory
+	assert os.listdir(str(tmpdir)) == []
+	# The profile for ImageCms is looked up by ID
+	cmsprofile = parser._getcmsprofile(profile)
+	assert cmsprofile is parser._cmsprofiles[profile.ID]
+	transform = ImageCms.buildTransform(cmsprofile,
+										ImageCms.createProfile("sRGB"),
+										"RGB", "RGB")
+	image = Image.new("RGB", (4, 4), (255, 0, 0))
+	assert transform.apply(image).getpixel((0, 0)) == (255, 0, 0)
+
+
+def test_file_profiles_cached(tmpdir):
+	filename = str(tmpdir.join("sRGB.icc"))
+	open(filename, "wb").write(profiledata())
+	parser = opi.OPIparser()
+	profile = opi.ICCProfile(filename)
+	cmsprofile = parser._getcmsprofile(profile)
+	assert parser._getcmsprofile(opi.ICCProfile(filename)) is cmsprofile
+	assert parser._cmsprofiles.keys() == [filename]
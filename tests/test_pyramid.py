@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+# opi.py needs wxPython
+pytest.importorskip("wx")
+
+# Also puts opi and makejob on the import path
+from opirun import geometry, process, run
+
+import makejob
+import opi
+
+
+@pytest.mark.parametrize("pyramidcache", ["memory", "disk"])
+@pytest.mark.parametrize("dpi", [1100, 1200, 2500])
+def test_pyramid_geometry(tmpdir, pyramidcache, dpi):
+	# 1100 dpi to 300 dpi reduces to pyramid level 1 (550 dpi), leaving a
+	# remaining factor below the downsample threshold
+	job = makejob.makejob(str(tmpdir.join("job")), placements=4, repeats=2,
+						  crop=.6, formats=("tiff", ), modes=("RGB", "L"),
+						  size=(1100, 750), dpi=dpi)
+	expected = geometry(process(job["job"], job["hires"],
+								str(tmpdir.join("out.ps"))))
+	assert len(expected) == 4
+	for run in xrange(2):
+		# The second run uses the pyramid levels stored on disk
+		result = geometry(process(job["job"], job["hires"],
+								  str(tmpdir.join("out-pyramid.ps")),
+								  pyramidcache=pyramidcache))
+		# Placements 1 and 2 are the first of each image, 3 and 4 repeat
+		# them and are taken from the cache like without the pyramid
+		assert result == expected
+
+
+@pytest.mark.parametrize("pyramidcache", ["memory", "disk"])
+def test_pyramid_repeat_cached(tmpdir, pyramidcache):
+	# The processed image of the first placement is used again for the
+	# second. 1440 dpi gives a placed size without rounding errors, so both
+	# placements have the same cache key.
+	job = makejob.makejob(str(tmpdir.join("job")), placements=2, repeats=2,
+						  crop=.6, formats=("tiff", ), modes=("RGB", ),
+						  dpi=1440)
+	parser = run(job["job"], job["hires"], str(tmpdir.join("out.ps")),
+				 pyramidcache=pyramidcache)
+	first, second = parser._stats.images
+	assert "downsample" in first.wall
+	assert second.cache == "memory"
+	assert "downsample" not in second.wall
+
+
+@pytest.mark.parametrize("dpi,level", [(600, 1), (1200, 2), (2400, 3)])
+def test_pyramid_level(tmpdir, monkeypatch, dpi, level):
+	# Exact 2x, 4x and 8x reductions to 300 dpi use the level which needs
+	# no further downsampling, whatever the rounding of the placed size.
+	# The default threshold of 2.0 would leave 600 dpi alone.
+	reductions = []
+	_SetReducedImage = opi.OPIparser._SetReducedImage
+	def SetReducedImage(self, image, size, key, factor):
+		reductions.append(float(size[0]) / image.size[0])
+		return _SetReducedImage(self, image, size, key, factor)
+	monkeypatch.setattr(opi.OPIparser, "_SetReducedImage", SetReducedImage)
+	job = makejob.makejob(str(tmpdir.join("job")), placements=4, repeats=4,
+						  crop=.6, formats=("tiff", ), modes=("RGB", ),
+						  dpi=dpi)
+	process(job["job"], job["hires"], str(tmpdir.join("out.ps")),
+			pyramidcache="memory", ColorImageDownsampleThreshold=1.5)
+	assert reductions
+	assert reductions == [2 ** level] * len(reductions)
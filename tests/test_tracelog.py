@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+	os.path.abspath(__file__))), "lib"))
+
+import TraceLog
+from TraceLog import TraceLog as Trace
+
+
+def load(filename):
+	return json.load(open(filename, "rb"))
+
+
+def test_events(tmpdir):
+	filename = str(tmpdir.join("trace.json"))
+	trace = Trace(filename)
+	trace.begin("OPI object", "object", image="a.tif")
+	trace.instant("cache hit", "cache", path="a.tif")
+	trace.counter("memory", rss=1024)
+	trace.end("OPI object", "object", bytes_out=10)
+	trace.close()
+	data = load(filename)
+	assert data["displayTimeUnit"] == "ms"
+	metadata = [event for event in data["traceEvents"] if event["ph"] == "M"]
+	events = [event for event in data["traceEvents"] if event["ph"] != "M"]
+	name = threading.currentThread().getName()
+	assert metadata == [{"name": "thread_name", "ph": "M",
+						 "pid": os.getpid(), "tid": events[0]["tid"],
+						 "args": {"name": name}}]
+	assert [(event["ph"], event["name"], event.get("cat"), event["args"])
+			for event in events] == [
+		("B", "OPI object", "object", {"image": "a.tif"}),
+		("i", "cache hit", "cache", {"path": "a.tif"}),
+		("C", "memory", None, {"rss": 1024}),
+		("E", "OPI object", "object", {"bytes_out": 10})]
+	assert events[1]["s"] == "t"
+	timestamps = [event["ts"] for event in events]
+	assert timestamps == sorted(timestamps)
+	assert timestamps[0] >= 0
+	for event in events:
+		assert event["pid"] == os.getpid()
+
+
+def test_threads(tmpdir):
+	filename = str(tmpdir.join("trace.json"))
+	trace = Trace(filename)
+	trace.threadname("main")
+	# Keep the workers running until all of them are done, so their thread
+	# idents are not reused
+	done = threading.Event()
+	def work(i):
+		trace.begin("band", "resize", band=i)
+		trace.end("band", "resize")
+		done.wait()
+	threads = [threading.Thread(target=work, args=(i, ), name="worker %i" % i)
+			   for i in xrange(3)]
+	for thread in threads:
+		thread.start()
+	while len(trace.events) < 6:
+		time.sleep(.01)
+	done.set()
+	for thread in threads:
+		thread.join()
+	trace.close()
+	data = load(filename)
+	names = dict((event["tid"], event["args"]["name"])
+				 for event in data["traceEvents"] if event["ph"] == "M")
+	assert sorted(names.values()) == ["main", "worker 0", "worker 1",
+									  "worker 2"]
+	for event in data["traceEvents"]:
+		if event["ph"] == "B":
+			assert names[event["tid"]] == "worker %i" % event["args"]["band"]
+
+
+def test_current():
+	trace = Trace("trace.json")
+	assert TraceLog.getcurrent() is None
+	TraceLog.setcurrent(trace)
+	try:
+		assert TraceLog.getcurrent() is trace
+	finally:
+		TraceLog.setcurrent(None)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+# opi.py needs wxPython
+pytest.importorskip("wx")
+
+# Also puts opi on the import path
+import opirun
+
+from opi import TransformCache
+
+
+def test_lru_eviction():
+	cache = TransformCache(3)
+	for key in "abc":
+		assert cache.set(key, key.upper()) == 0
+	# Using a makes b the least recently used
+	assert cache.get("a") == "A"
+	assert cache.set("d", "D") == 1
+	assert len(cache) == 3
+	assert cache.get("b") is None
+	assert cache.get("a") == "A"
+	assert cache.get("c") == "C"
+	assert cache.get("d") == "D"
+	assert (cache.hits, cache.misses, cache.evictions) == (4, 1, 1)
+	assert cache.getstats() == ("3 transform(s), 4 hit(s), 1 miss(es), "
+								"1 eviction(s)")
+
+
+def test_replace():
+	cache = TransformCache(2)
+	cache.set("a", 1)
+	cache.set("b", 2)
+	# Setting an existing key evicts nothing and makes it the most recently
+	# used
+	assert cache.set("a", 3) == 0
+	assert cache.set("c", 4) == 1
+	assert cache.get("b") is None
+	assert cache.get("a") == 3
+	assert cache.evictions == 1
+
+
+def test_shrink():
+	cache = TransformCache(4)
+	for i in xrange(4):
+		cache.set(i, i)
+	cache.maxsize = 2
+	assert cache.set(4, 4) == 3
+	assert len(cache) == 2
+	assert cache.get(3) == 3
+	assert cache.get(4) == 4
+
+
+def test_unbounded():
+	cache = TransformCache(0)
+	for i in xrange(100):
+		assert cache.set(i, i) == 0
+	assert len(cache) == 100
+	assert cache.evictions == 0
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+import binascii
+import os
+import random
+import struct
+import sys
+
+import pytest
+from PIL import Image, ImageCms
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.util_image import (RESIZE_BOX, channels_equal, cmsapply_tiled,
+							 load_region, reduce_resize, resize,
+							 resize_parallel)
+
+_noise = {}
+
+filters = [Image.ANTIALIAS]
+if hasattr(Image, "BOX"):
+	filters.append(Image.BOX)
+
+
+def noise(mode, size, seed=0):
+	""" Random image, so any misplaced band or strip shows """
+	if (mode, size, seed) in _noise:
+		return _noise[(mode, size, seed)]
+	count = size[0] * size[1] * len(mode)
+	data = binascii.unhexlify("%0*x" % (count * 2, random.Random(seed)
+												   .getrandbits(count * 8)))
+	if hasattr(Image, "frombytes"):
+		image = Image.frombytes(mode, size, data)
+	else:
+		image = Image.fromstring(mode, size, data)
+	_noise[(mode, size, seed)] = image
+	return image
+
+
+def tobytes(image):
+	if hasattr(image, "tobytes"):
+		return image.tobytes()
+	return image.tostring()
+
+
+@pytest.mark.parametrize("mode", ["L", "RGB", "CMYK"])
+@pytest.mark.parametrize("resample", filters)
+@pytest.mark.parametrize("workers", [2, 3, 8])
+@pytest.mark.parametrize("source,size", [((480, 320), (120, 80)),
+										 ((480, 320), (173, 91)),
+										 ((480, 320), (480, 107)),
+										 ((480, 320), (151, 320)),
+										 ((150, 100), (409, 277))])
+def test_resize_parallel(mode, resample, workers, source, size):
+	image = noise(mode, source)
+	expected = image.resize(size, resample)
+	result = resize_parallel(image, size, resample, workers, minheight=8)
+	assert result.mode == expected.mode
+	assert result.size == expected.size
+	assert tobytes(result) == tobytes(expected)
+
+
+@pytest.mark.skipif(not RESIZE_BOX, reason="needs Image.resize() box")
+@pytest.mark.parametrize("mode", ["L", "RGB", "CMYK"])
+@pytest.mark.parametrize("resample", filters)
+@pytest.mark.parametrize("workers", [2, 3, 8])
+@pytest.mark.parametrize("box,size", [((48, 32, 432, 288), (96, 64)),
+									  ((40.5, 17.25, 401.75, 300), (113, 77)),
+									  ((0, 60.5, 480, 250), (200, 81)),
+									  ((100, 100, 150, 140), (211, 160))])
+def test_resize_parallel_box(mode, resample, workers, box, size):
+	image = noise(mode, (480, 320))
+	expected = resize(image, size, resample, box)
+	result = resize_parallel(image, size, resample, workers, box, minheight=8)
+	assert result.size == expected.size
+	assert tobytes(result) == tobytes(expected)
+
+
+def test_resize_parallel_fallback():
+	# Filters other than antialias and box are resized in one go
+	image = noise("RGB", (200, 150))
+	result = resize_parallel(image, (70, 50), Image.BICUBIC, 4, minheight=8)
+	assert (tobytes(result) ==
+			tobytes(image.resize((70, 50), Image.BICUBIC)))
+
+
+class OldTransform(object):
+
+	""" Transform with the attributes of PIL 1.1.7's ImageCmsTransform """
+
+	def __init__(self, transform):
+		self.transform = transform
+		self.outputMode = transform.output_mode
+
+	def apply(self, image):
+		return self.transform.apply(image)
+
+
+@pytest.mark.parametrize("old", [False, True])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_cmsapply_tiled(old, workers):
+	image = noise("RGB", (200, 150))
+	transform = ImageCms.buildTransform(ImageCms.createProfile("sRGB"),
+										ImageCms.createProfile("LAB"),
+										"RGB", "LAB")
+	expected = transform.apply(image)
+	if old:
+		transform = OldTransform(transform)
+	result = cmsapply_tiled(transform, image, workers, minheight=8)
+	assert result.mode == "LAB"
+	assert tobytes(result) == tobytes(expected)
+
+
+def gradient(mode, size):
+	""" Smooth image, where both resizing methods should agree closely """
+	image = Image.linear_gradient("L")
+	channels = [image, image.transpose(Image.ROTATE_90),
+				image.transpose(Image.FLIP_TOP_BOTTOM),
+				image.transpose(Image.ROTATE_270)]
+	return Image.merge(mode, [channel.resize(size, Image.BILINEAR)
+							  for channel in channels[:len(mode)]])
+
+
+def difference(image1, image2):
+	""" Largest difference of any channel of two images """
+	return max(a - b if a > b else b - a for a, b in
+			   zip(bytearray(tobytes(image1)), bytearray(tobytes(image2))))
+
+
+@pytest.mark.skipif(not hasattr(Image, "BOX"), reason="needs Image.BOX")
+@pytest.mark.parametrize("mode", ["L", "RGB", "CMYK"])
+@pytest.mark.parametrize("workers", [1, 3])
+@pytest.mark.parametrize("size,box", [((60, 40), None),
+									  ((30, 20), None),
+									  ((37, 23), None),
+									  ((25, 17), (40, 30, 240, 170))])
+def test_reduce_resize(mode, workers, size, box):
+	image = gradient(mode, (480, 320))
+	result = reduce_resize(image, size, Image.ANTIALIAS, workers, box,
+						   minheight=8)
+	expected = resize(image, size, Image.ANTIALIAS, box)
+	assert result.mode == mode
+	assert result.size == size
+	# Slightly softer than a single antialias resize, same geometry
+	assert difference(result, expected) <= 2
+
+
+@pytest.mark.parametrize("size", [(300, 200), (480, 320)])
+def test_reduce_resize_fallback(size):
+	# Factors below 2 are resized in one go
+	image = noise("RGB", (480, 320))
+	result = reduce_resize(image, size, Image.ANTIALIAS, 3, minheight=8)
+	assert (tobytes(result) ==
+			tobytes(resize_parallel(image, size, Image.ANTIALIAS, 3,
+									minheight=8)))
+
+
+@pytest.mark.parametrize("mode", ["RGB", "CMYK"])
+def test_channels_equal(mode):
+	gray = noise("L", (50, 300))
+	image = Image.merge(mode, [gray] * len(mode))
+	assert channels_equal(image, minheight=8)
+	assert channels_equal(gray, minheight=8)
+	# A single pixel in any band and channel
+	for y in (0, 150, 299):
+		for channel in xrange(1, len(mode)):
+			pixel = list(image.getpixel((49, y)))
+			pixel[channel] ^= 1
+			changed = image.copy()
+			changed.putpixel((49, y), tuple(pixel))
+			assert not channels_equal(changed, minheight=8), (y, channel)
+
+
+def test_channels_equal_early_exit(monkeypatch):
+	image = noise("RGB", (50, 300))
+	crops = []
+	crop = Image.Image.crop
+	def recordcrop(self, box=None):
+		crops.append(box)
+		return crop(self, box)
+	monkeypatch.setattr(Image.Image, "crop", recordcrop)
+	assert not channels_equal(image, minheight=8)
+	# Stops at the first band
+	assert crops == [(0, 0, 50, 8)]
+
+
+def savestriped(image, filename, rowsperstrip):
+	"""
+	Save an L or RGB image as uncompressed TIFF with several strips.
+
+	PIL writes a single strip, and strips written by libtiff are decoded
+	by libtiff as a whole.
+
+	"""
+	width, height = image.size
+	bands = len(image.mode)
+	data = tobytes(image)
+	stripsize = width * rowsperstrip * bands
+	strips = [data[i:i + stripsize] for i in xrange(0, len(data), stripsize)]
+	# Header, strip data, then the arrays and the IFD
+	offset = 8
+	offsets = []
+	for strip in strips:
+		offsets.append(offset)
+		offset += len(strip)
+	arrays = {}
+	extra = []
+	for tag, values in ((258, [8] * bands), (273, offsets),
+						(279, [len(strip) for strip in strips])):
+		if len(values) > 1:
+			arrays[tag] = offset
+			extra.append(struct.pack("<%iI" % len(values), *values))
+			offset += 4 * len(values)
+	def entry(tag, values):
+		if tag in arrays:
+			return struct.pack("<HHII", tag, 4, len(values), arrays[tag])
+		return struct.pack("<HHII", tag, 4, 1, values[0])
+	entries = [entry(256, [width]), entry(257, [height]),
+			   entry(258, [8] * bands), entry(259, [1]),
+			   entry(262, [bands == 3 and 2 or 1]), entry(273, offsets),
+			   entry(277, [bands]), entry(278, [rowsperstrip]),
+			   entry(279, [len(strip) for strip in strips]),
+			   entry(284, [1])]
+	tiff = open(filename, "wb")
+	try:
+		tiff.write(struct.pack("<2sHI", "II", 42, offset))
+		tiff.write("".join(strips + extra))
+		tiff.write(struct.pack("<H", len(entries)) + "".join(entries) +
+				   struct.pack("<I", 0))
+	finally:
+		tiff.close()
+
+
+@pytest.mark.parametrize("mode", ["L", "RGB"])
+def test_load_region(tmpdir, mode):
+	image = noise(mode, (40, 100))
+	filename = str(tmpdir.join("striped.tif"))
+	savestriped(image, filename, 16)
+	striped = Image.open(filename)
+	assert len(striped.tile) == 7
+	assert load_region(striped, (5, 20, 30, 40))
+	# Strips 1 and 2 (rows 16 to 48) are read, the others left blank
+	for y in xrange(0, 100, 16):
+		box = (0, y, 40, min(y + 16, 100))
+		if y in (16, 32):
+			expected = image.crop(box)
+		else:
+			expected = Image.new(mode, (40, box[3] - y))
+		assert tobytes(striped.crop(box)) == tobytes(expected), y
+
+
+def test_load_region_untouched(tmpdir):
+	image = noise("L", (40, 100))
+	filename = str(tmpdir.join("striped.tif"))
+	savestriped(image, filename, 16)
+	# All strips intersect the box
+	striped = Image.open(filename)
+	assert not load_region(striped, (0, 10, 40, 98))
+	assert len(striped.tile) == 7
+	assert tobytes(striped) == tobytes(image)
+	# A single strip
+	savestriped(image, filename, 100)
+	striped = Image.open(filename)
+	assert not load_region(striped, (5, 20, 30, 40))
+	assert tobytes(striped) == tobytes(image)
+	# Already loaded
+	striped = Image.open(filename)
+	striped.load()
+	assert not load_region(striped, (5, 20, 30, 40))
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+from cStringIO import StringIO
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import util_io
+from lib.util_io import MappedInput, OutputBuffer
+
+
+def test_coalesce(tmpdir):
+	fileobj = open(str(tmpdir.join("out")), "wb")
+	out = OutputBuffer(fileobj, 16)
+	for data in ("abc", "def", "ghi"):
+		out.write(data)
+	assert out.writes == 0
+	assert out.tell() == 9
+	out.flush()
+	assert out.writes == 1
+	# bufsize bytes pending are written right away
+	out.write("0123456789")
+	out.write("abcdef")
+	assert out.writes == 2
+	fileobj.close()
+	assert tmpdir.join("out").read() == "abcdefghi0123456789abcdef"
+	assert out.bytes == out.tell() == 25
+
+
+def test_large_write(tmpdir):
+	fileobj = open(str(tmpdir.join("out")), "wb")
+	out = OutputBuffer(fileobj, 16)
+	out.write("abc")
+	out.write("def")
+	data = "x" * 20 + "y" * 20
+	# A view of a larger string is written as it is
+	out.write(buffer(data, 10))
+	assert out.writes == 2
+	fileobj.close()
+	assert tmpdir.join("out").read() == "abcdef" + data[10:]
+
+
+def test_partial_write(tmpdir, monkeypatch):
+	# os.write() may write less than it was given
+	write = os.write
+	monkeypatch.setattr(util_io.os, "write",
+						lambda fd, data: write(fd, str(data)[:7]))
+	fileobj = open(str(tmpdir.join("out")), "wb")
+	out = OutputBuffer(fileobj, 16)
+	data = "".join(chr(i) for i in xrange(256))
+	out.write(data)
+	out.write("abc")
+	out.flush()
+	fileobj.close()
+	assert tmpdir.join("out").read() == data + "abc"
+	# 37 for the large write, 1 for the small one
+	assert out.writes == 38
+
+
+def test_fileobj():
+	# File objects without a file descriptor are written to directly
+	fileobj = StringIO()
+	out = OutputBuffer(fileobj, 16)
+	out.write("abc")
+	assert fileobj.getvalue() == ""
+	out.write("x" * 20)
+	assert fileobj.getvalue() == "abc" + "x" * 20
+	assert out.writes == 2
+
+
+def test_copyrange(tmpdir):
+	data = "".join(chr(i % 256) for i in xrange(200000))
+	tmpdir.join("in").write(data, "wb")
+	infile = open(str(tmpdir.join("in")), "rb")
+	fileobj = open(str(tmpdir.join("out")), "wb")
+	out = OutputBuffer(fileobj, 16)
+	out.write("abc")
+	# Read in chunks
+	out.copyrange(infile.fileno(), 1000, 150000)
+	out.write("def")
+	# Written from the view
+	out.copyrange(infile.fileno(), 10, 20, buffer(data, 10, 20))
+	out.flush()
+	infile.close()
+	fileobj.close()
+	assert (tmpdir.join("out").read("rb") ==
+			"abc" + data[1000:151000] + "def" + data[10:30])
+	assert out.copied == 150020
+	assert out.bytes == out.tell() == 150026
+	assert out.getcopystats().startswith("150020 bytes passed through")
+
+
+def test_copyrange_mapped(tmpdir):
+	data = "line 1\nline 2\nline 3"
+	tmpdir.join("in").write(data, "wb")
+	mapped = MappedInput(str(tmpdir.join("in")))
+	try:
+		assert len(mapped) == len(data)
+		assert list(mapped) == ["line 1\n", "line 2\n", "line 3"]
+		assert mapped.find("line", 1) == 7
+		assert mapped.rfind("line", 0, 11) == 7
+		out = StringIO()
+		buf = OutputBuffer(out, 16)
+		buf.copyrange(mapped.fileno(), 7, 7, mapped.view(7, 14))
+		assert out.getvalue() == "line 2\n"
+	finally:
+		mapped.close()